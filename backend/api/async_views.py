@@ -0,0 +1,168 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+from rest_framework.renderers import JSONRenderer
+
+from .catalog import ingredient_catalog, tag_catalog
+from .instrumentation import get_metrics
+from .short_links import (
+    contains,
+    decode,
+    recipe_ids,
+    recipe_redirect,
+    short_link_redirect,
+)
+from .serializers import IngredientSerializer, TagSerializer
+from .views import IngredientViewSet, RecipeViewSet, TagViewSet
+
+# В Django 3.2 нет асинхронного ORM, поэтому всё, что обращается к базе
+# или общему кешу, выполняется через sync_to_async в потоке запроса
+# (см. backend/asgi.py), а цикл событий тем временем обслуживает другие
+# запросы. В самом цикле отдаются только ответы из памяти процесса.
+
+
+async def run_sync(request, func, *args, **kwargs):
+    """Синхронный код запроса в отдельном потоке, с учётом его SQL."""
+    metrics = get_metrics(request)
+
+    def call():
+        if metrics is None:
+            return func(*args, **kwargs)
+        with metrics.capture():
+            return func(*args, **kwargs)
+
+    return await sync_to_async(call)()
+
+
+def async_read(sync_view, memory=None, action=None):
+    """Асинхронная обёртка над представлением DRF.
+
+    GET и HEAD сначала пробуют memory(request, ...) - ответ из памяти
+    без блокирующих вызовов; если он вернул None, запрос, как и все
+    изменяющие методы, обрабатывает синхронное представление DRF.
+    """
+
+    @wraps(sync_view)
+    async def view(request, *args, **kwargs):
+        if memory is not None and request.method in ('GET', 'HEAD'):
+            response = memory(request, *args, **kwargs)
+            if response is not None:
+                metrics = get_metrics(request)
+                if metrics is not None:
+                    metrics.action = action
+                return response
+        return await run_sync(request, sync_view, request, *args, **kwargs)
+
+    return view
+
+
+def accepts_json(request):
+    """Без явного запроса другого формата (например, HTML для
+    просмотра API в браузере) DRF ответил бы в JSON.
+    """
+    return (
+        'format' not in request.GET
+        and 'text/html' not in request.headers.get('Accept', '')
+    )
+
+
+def json_response(data, etag=None):
+    response = HttpResponse(
+        JSONRenderer().render(data), content_type='application/json'
+    )
+    response['Vary'] = 'Accept'
+    if etag is not None:
+        response['ETag'] = etag
+    return response
+
+
+def catalog_list(catalog, bypass_params=()):
+    """Список справочника из памяти, с ETag, как у CatalogViewSetMixin.
+
+    Токен не проверяется: справочники открыты для чтения всем.
+    """
+
+    def memory(request):
+        if not accepts_json(request) or set(request.GET) & set(bypass_params):
+            return None
+        if catalog.peek() is None:
+            return None
+        etag = catalog.current_etag()
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
+        return json_response(catalog.rows, etag)
+
+    return memory
+
+
+def catalog_detail(catalog, serializer_class):
+
+    def memory(request, pk):
+        if not accepts_json(request):
+            return None
+        if catalog.peek() is None:
+            return None
+        instance = catalog.get_cached_object(int(pk))
+        if instance is None:
+            return None
+        return json_response(serializer_class(instance).data)
+
+    return memory
+
+
+def short_link_memory(request, code):
+    pk = decode(code)
+    ids = recipe_ids.peek()
+    if pk is None or ids is None or not contains(ids, pk):
+        return None
+    return recipe_redirect(request, pk)
+
+
+tag_list = async_read(
+    TagViewSet.as_view({'get': 'list'}, basename='tags', detail=False),
+    memory=catalog_list(tag_catalog),
+    action='TagViewSet.list',
+)
+tag_detail = async_read(
+    TagViewSet.as_view({'get': 'retrieve'}, basename='tags', detail=True),
+    memory=catalog_detail(tag_catalog, TagSerializer),
+    action='TagViewSet.retrieve',
+)
+ingredient_list = async_read(
+    IngredientViewSet.as_view(
+        {'get': 'list'}, basename='ingredients', detail=False
+    ),
+    memory=catalog_list(
+        ingredient_catalog, IngredientViewSet.catalog_bypass_params
+    ),
+    action='IngredientViewSet.list',
+)
+ingredient_detail = async_read(
+    IngredientViewSet.as_view(
+        {'get': 'retrieve'}, basename='ingredients', detail=True
+    ),
+    memory=catalog_detail(ingredient_catalog, IngredientSerializer),
+    action='IngredientViewSet.retrieve',
+)
+recipe_list = async_read(RecipeViewSet.as_view(
+    {'get': 'list', 'post': 'create'}, basename='recipes', detail=False
+))
+recipe_detail = async_read(RecipeViewSet.as_view(
+    {
+        'get': 'retrieve',
+        'put': 'update',
+        'patch': 'partial_update',
+        'delete': 'destroy',
+    },
+    basename='recipes',
+    detail=True,
+))
+short_link = async_read(
+    short_link_redirect,
+    memory=short_link_memory,
+    action='short_link_redirect',
+)
@@ -0,0 +1,135 @@
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .db_router import read_from_primary
+
+_local_versions = {}
+_last_request = {'started': 0.0}
+
+
+def get_shared_cache():
+    """Общий для всех воркеров кеш или None, если он не настроен."""
+    alias = getattr(settings, 'API_CACHE_ALIAS', None)
+    return caches[alias] if alias else None
+
+
+def new_version():
+    return f'{int(time.time())}-{uuid.uuid4().hex}'
+
+
+def version_timestamp(version):
+    """Время (unix) создания версии."""
+    return int(version.split('-', 1)[0])
+
+
+def get_versions(names):
+    """Текущие версии именованных наборов данных.
+
+    Версия - время создания и случайная строка, а не счётчик: после
+    вытеснения ключа из общего кеша новая версия не совпадёт ни с одной
+    из старых.
+    """
+    shared = get_shared_cache()
+    if shared is None:
+        return {
+            name: _local_versions.setdefault(name, new_version())
+            for name in names
+        }
+    keys = {f'version:{name}': name for name in names}
+    versions = shared.get_many(keys)
+    for key, name in keys.items():
+        if key not in versions:
+            shared.add(key, new_version(), timeout=None)
+            versions[key] = shared.get(key)
+    return {name: versions[key] for key, name in keys.items()}
+
+
+def get_version(name):
+    return get_versions((name,))[name]
+
+
+def bump_version(name):
+    version = new_version()
+    shared = get_shared_cache()
+    if shared is None:
+        _local_versions[name] = version
+    else:
+        shared.set(f'version:{name}', version, timeout=None)
+    return version
+
+
+def mark_request_started(**kwargs):
+    """Значения per_request, загруженные до начала запроса, устарели."""
+    _last_request['started'] = time.monotonic()
+
+
+class VersionedValue:
+    """Значение в памяти воркера, перестраиваемое при смене версии.
+
+    Если общий кеш настроен, построенное значение кладётся и в него,
+    чтобы остальные воркеры не ходили за ним в базу. Без общего кеша
+    версии не видны другим процессам: значение с per_request
+    загружается заново в каждом запросе, остальные устаревают через
+    API_LOCAL_CACHE_TTL секунд. Отставание допустимо, только если его
+    перепроверяет вызывающий код.
+    """
+
+    def __init__(self, name, loader, per_request=False):
+        self.name = name
+        self.loader = loader
+        self.per_request = per_request
+        self.version = None
+        self.value = None
+        self.loaded_at = 0
+
+    def get(self):
+        version = get_version(self.name)
+        shared = get_shared_cache()
+        expired = shared is None and self.local_expired()
+        if version != self.version or expired:
+            value = None
+            key = f'{self.name}:{version}'
+            if shared is not None:
+                value = shared.get(key)
+            if value is None:
+                with read_from_primary():
+                    value = self.loader()
+                if shared is not None:
+                    shared.set(key, value)
+            self.version = version
+            self.value = value
+            self.loaded_at = time.monotonic()
+        return self.value
+
+    def peek(self):
+        """Значение, если его можно отдать без обращения к базе и общему
+        кешу, иначе None. Нужно асинхронным представлениям: всё, что
+        дольше проверки в памяти, они выполняют в отдельном потоке.
+        """
+        if get_shared_cache() is not None or self.version is None:
+            return None
+        if (
+            self.version != _local_versions.get(self.name)
+            or self.local_expired()
+        ):
+            return None
+        return self.value
+
+    def local_expired(self):
+        if self.per_request:
+            return self.loaded_at < _last_request['started']
+        return (
+            time.monotonic() - self.loaded_at > settings.API_LOCAL_CACHE_TTL
+        )
+
+    def __deepcopy__(self, memo):
+        """Значение общее для процесса: DRF копирует аргументы полей
+        сериализатора, и копия заново загружала бы данные.
+        """
+        return self
+
+    def invalidate(self):
+        bump_version(self.name)
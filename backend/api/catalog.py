@@ -0,0 +1,133 @@
+from django.db.models import CharField, Value
+
+from recipes.models import Ingredient, Tag
+from .cache import VersionedValue
+from .ingredient_snapshot import get_snapshot, snapshot_file
+
+
+class Catalog(VersionedValue):
+    """Справочник целиком: строки для ответа списком и объекты по id."""
+
+    def __init__(self, model):
+        self.model = model
+        super().__init__(
+            f'catalog:{model._meta.label_lower}', self.load, per_request=True
+        )
+
+    def load(self):
+        objects = list(self.model.objects.all())
+        fields = [field.attname for field in self.model._meta.concrete_fields]
+        return {
+            'rows': [
+                {field: getattr(obj, field) for field in fields}
+                for obj in objects
+            ],
+            'objects': {obj.id: obj for obj in objects},
+        }
+
+    @property
+    def rows(self):
+        return self.get()['rows']
+
+    def get_object(self, pk):
+        return self.get()['objects'].get(pk)
+
+    def get_cached_object(self, pk):
+        """Объект только из памяти, без обращения к базе."""
+        return self.get_object(pk)
+
+    @property
+    def etag(self):
+        self.get()
+        return self.current_etag()
+
+    def current_etag(self):
+        """ETag уже загруженной версии справочника."""
+        return f'"{self.name}:{self.version}"'
+
+
+class IngredientCatalog(Catalog):
+    """Ингредиенты из снимка в файле, общего для всех воркеров, если он
+    построен командой build_ingredient_snapshot и не устарел; иначе -
+    как остальные справочники, копией в памяти каждого процесса.
+    """
+
+    def __init__(self):
+        super().__init__(Ingredient)
+
+    @property
+    def rows(self):
+        snapshot = get_snapshot()
+        if snapshot is None:
+            return super().rows
+        return snapshot.rows()
+
+    def get_object(self, pk):
+        snapshot = get_snapshot()
+        if snapshot is None:
+            return super().get_object(pk)
+        instance = snapshot.get_object(pk)
+        if instance is None:
+            # Ингредиент мог появиться после сборки снимка.
+            instance = Ingredient.objects.filter(pk=pk).first()
+        return instance
+
+    def get_cached_object(self, pk):
+        snapshot = get_snapshot()
+        if snapshot is None:
+            return super().get_cached_object(pk)
+        return snapshot.get_object(pk)
+
+    @property
+    def etag(self):
+        if get_snapshot() is None:
+            return super().etag
+        return self.current_etag()
+
+    def current_etag(self):
+        snapshot = get_snapshot()
+        if snapshot is None:
+            return super().current_etag()
+        return f'"{self.name}:{snapshot.version}"'
+
+    def peek(self):
+        snapshot = get_snapshot()
+        if snapshot is None:
+            return super().peek()
+        return snapshot
+
+    def invalidate(self):
+        """Снимок не пересобирается в запросе: он помечается устаревшим,
+        и до сборки командой build_ingredient_snapshot ингредиенты
+        читаются из базы.
+        """
+        snapshot_file.mark_stale()
+        super().invalidate()
+
+
+tag_catalog = Catalog(Tag)
+ingredient_catalog = IngredientCatalog()
+
+CATALOGS = {
+    Tag: tag_catalog,
+    Ingredient: ingredient_catalog,
+}
+
+
+def missing_ids(ids_by_model):
+    """Id из {модель: id}, которых нет в базе, одним запросом UNION ALL.
+
+    Справочник в памяти воркера может отставать от базы: удалённый
+    в другом процессе тег или ингредиент он ещё считает существующим.
+    """
+    querysets = [
+        model.objects.filter(pk__in=ids).annotate(
+            label=Value(model._meta.label, output_field=CharField())
+        ).values_list('label', 'pk').order_by()
+        for model, ids in ids_by_model.items()
+    ]
+    missing = {model: set(ids) for model, ids in ids_by_model.items()}
+    labels = {model._meta.label: model for model in ids_by_model}
+    for label, pk in querysets[0].union(*querysets[1:], all=True):
+        missing[labels[label]].discard(pk)
+    return missing
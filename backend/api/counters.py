@@ -0,0 +1,124 @@
+import threading
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from recipes.models import Favorite, Recipe
+from users.models import Follow
+from .cache import bump_version
+from .response_cache import (
+    invalidate_profile,
+    invalidate_recipe,
+    recipe_version,
+)
+
+User = get_user_model()
+
+# (модель, поле счётчика, связанная модель, внешний ключ на модель).
+COUNTERS = (
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Follow, 'author'),
+    (User, 'following_count', Follow, 'user'),
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+)
+
+RECIPE_RELATION_COUNTERS = {Favorite: 'favorites_count'}
+
+# Строки, счётчики которых пересчитываются после фиксации транзакции:
+# {модель: множество pk}, своё для каждого потока.
+_pending = threading.local()
+
+
+def adjust_counter(model, pk, field, delta):
+    """Меняет счётчик одним UPDATE, без чтения строки в память.
+
+    Вызывается в той же транзакции, что и изменение связи, поэтому
+    счётчик не расходится со связями при откате.
+    """
+    adjust_counters(model, (pk,), field, delta)
+
+
+def adjust_counters(model, pks, field, delta):
+    """То же для нескольких строк сразу, одним UPDATE ... IN."""
+    if pks:
+        model.objects.filter(pk__in=pks).update(
+            **{field: Greatest(F(field) + delta, 0)}
+        )
+
+
+def recipe_relation_changed(model, recipe_id, delta):
+    recipe_relations_changed(model, (recipe_id,), delta)
+
+
+def recipe_relations_changed(model, recipe_ids, delta):
+    field = RECIPE_RELATION_COUNTERS.get(model)
+    if field is None or not recipe_ids:
+        return
+    adjust_counters(Recipe, recipe_ids, field, delta)
+
+    def bump_versions():
+        for recipe_id in recipe_ids:
+            bump_version(recipe_version(recipe_id))
+
+    transaction.on_commit(bump_versions)
+
+
+def follow_changed(user_id, author_id, delta):
+    follows_changed(user_id, (author_id,), delta)
+
+
+def follows_changed(user_id, author_ids, delta):
+    if author_ids:
+        adjust_counters(User, author_ids, 'followers_count', delta)
+        adjust_counter(
+            User, user_id, 'following_count', delta * len(author_ids)
+        )
+
+
+def recount_later(model, pks):
+    """Пересчитывает счётчики строк model по фактическим связям после
+    фиксации текущей транзакции.
+
+    Для изменений в обход API: админка, каскадное удаление, удаление
+    через QuerySet. Пересчёт, в отличие от приращения, не зависит от
+    того, сколько раз и в каком порядке он выполнен, а строки всех
+    сигналов транзакции пересчитываются одним UPDATE на модель.
+    """
+    rows = getattr(_pending, 'rows', None)
+    if rows is None:
+        rows = _pending.rows = {}
+    rows.setdefault(model, set()).update(pks)
+    transaction.on_commit(recount_pending)
+
+
+def recount_pending():
+    rows = getattr(_pending, 'rows', None)
+    if not rows:
+        return
+    _pending.rows = {}
+    for model, pks in rows.items():
+        recount(model, pks)
+
+
+def recount(model, pks):
+    model.objects.filter(pk__in=pks).update(**{
+        field: actual_count(related, foreign_key)
+        for counted, field, related, foreign_key in COUNTERS
+        if counted is model
+    })
+    invalidate = invalidate_recipe if model is Recipe else invalidate_profile
+    for pk in pks:
+        invalidate(pk)
+
+
+def actual_count(related, foreign_key):
+    """Подзапрос с фактическим числом связанных строк."""
+    return Coalesce(Subquery(
+        related.objects.filter(**{foreign_key: OuterRef('pk')})
+        .order_by()
+        .values(foreign_key)
+        .annotate(total=Count('pk'))
+        .values('total')
+    ), 0)
@@ -0,0 +1,153 @@
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.permissions import SAFE_METHODS
+
+# Реплика для чтения в текущем запросе или None - основная база.
+# Контекстная переменная, а не атрибут потока: под ASGI она переходит
+# вместе с запросом в поток sync_to_async.
+_read_alias = ContextVar('read_alias', default=None)
+
+PRIMARY_COOKIE = 'primary_db_until'
+
+# Модели, которые всегда читаются из основной базы: токен, только что
+# выданный при входе, мог ещё не дойти до реплики.
+PRIMARY_ONLY_MODELS = ('authtoken.Token',)
+
+
+class ReplicaRouter:
+    """Запись и миграции - в основную базу, чтение - с реплики, если
+    запрос выполняется внутри read_from_replica().
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.label in PRIMARY_ONLY_MODELS:
+            return DEFAULT_DB_ALIAS
+        return _read_alias.get() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же строки, что и основная база.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
+
+
+@contextmanager
+def read_from_replica():
+    """Чтение с одной случайно выбранной реплики до выхода из блока.
+
+    Без настроенных реплик ничего не меняет.
+    """
+    replicas = settings.DATABASE_REPLICAS
+    token = _read_alias.set(random.choice(replicas) if replicas else None)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+@contextmanager
+def read_from_primary():
+    """Чтение из основной базы, в том числе внутри read_from_replica().
+
+    Всё, что кладётся в кеши под текущую версию данных, читается
+    из основной базы: отставшая реплика иначе закрепила бы в кеше
+    старые данные до следующей смены версии.
+    """
+    token = _read_alias.set(None)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def primary_pin_key(user_id):
+    return f'db:primary-pin:{user_id}'
+
+
+def pin_cache():
+    """Общий кеш, если он настроен: иначе закрепление видно только
+    воркеру, обработавшему изменение, и работает cookie.
+    """
+    alias = getattr(settings, 'API_CACHE_ALIAS', None)
+    return caches[alias or DEFAULT_CACHE_ALIAS]
+
+
+def is_pinned_to_primary(request):
+    """Клиент недавно что-то изменил: реплика могла ещё не получить
+    его изменения, поэтому он читает из основной базы.
+
+    Пользователь закрепляется по id в кеше, независимо от cookie
+    клиента; cookie - для анонимов и воркеров без общего кеша.
+    """
+    user = getattr(request, 'user', None)
+    if (
+        user is not None and user.is_authenticated
+        and pin_cache().get(primary_pin_key(user.pk))
+    ):
+        return True
+    try:
+        until = float(request.COOKIES.get(PRIMARY_COOKIE, 0))
+    except ValueError:
+        return False
+    return until > time.time()
+
+
+def pin_to_primary(response, user_id=None):
+    seconds = settings.DATABASE_PRIMARY_PIN_SECONDS
+    if user_id is not None:
+        pin_cache().set(primary_pin_key(user_id), True, seconds)
+    response.set_cookie(
+        PRIMARY_COOKIE,
+        str(int(time.time() + seconds)),
+        max_age=seconds,
+        httponly=True,
+        samesite='Lax',
+    )
+
+
+class ReplicaReadMixin:
+    """Действия из replica_actions на GET читают с реплики.
+
+    Успешный изменяющий запрос закрепляет пользователя (и клиента
+    через cookie) за основной базой на DATABASE_PRIMARY_PIN_SECONDS
+    секунд: например, страница рецепта сразу после его создания.
+    Реплика выбирается после аутентификации: токен и закрепление
+    пользователя проверяются по основной базе и кешу.
+    """
+
+    replica_actions = ()
+
+    def dispatch(self, request, *args, **kwargs):
+        if not settings.DATABASE_REPLICAS:
+            return super().dispatch(request, *args, **kwargs)
+        if request.method in SAFE_METHODS:
+            # initial() переключает чтение на реплику до конца запроса.
+            with read_from_primary():
+                return super().dispatch(request, *args, **kwargs)
+        response = super().dispatch(request, *args, **kwargs)
+        if response.status_code < 400:
+            user = self.request.user
+            pin_to_primary(
+                response, user.pk if user.is_authenticated else None
+            )
+        return response
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if (
+            settings.DATABASE_REPLICAS
+            and request.method in SAFE_METHODS
+            and self.action in self.replica_actions
+            and not is_pinned_to_primary(request)
+        ):
+            _read_alias.set(random.choice(settings.DATABASE_REPLICAS))
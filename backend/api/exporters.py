@@ -0,0 +1,95 @@
+import csv
+import json
+
+from django.db.models import Sum
+
+from recipes.models import Ingredient, RecipeIngredients
+from .ingredient_snapshot import get_snapshot
+
+
+class Echo:
+    """Буфер для csv.writer, который сразу возвращает записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def shopping_list_rows(user):
+    """Ингредиенты из списка покупок пользователя одним запросом.
+
+    Если построен снимок справочника, база только суммирует количества
+    по id, а названия берутся из снимка. Строки читаются целиком здесь,
+    в потоке представления: под ASGI тело потокового ответа отдаётся
+    из цикла событий, где обращаться к базе нельзя.
+    """
+    items = RecipeIngredients.objects.filter(
+        recipe__shopping_list__user=user
+    )
+    snapshot = get_snapshot()
+    if snapshot is None:
+        return list(
+            items
+            .values('ingredient__name', 'ingredient__measurement_unit')
+            .annotate(amount=Sum('amount'))
+            .order_by('ingredient__name')
+        )
+    totals = items.values('ingredient_id').annotate(
+        amount=Sum('amount')
+    ).order_by()
+    entries = {}
+    missing = []
+    for row in totals:
+        entry = snapshot.get(row['ingredient_id'])
+        if entry is None:
+            missing.append(row['ingredient_id'])
+        entries[row['ingredient_id']] = (entry, row['amount'])
+    if missing:
+        for ingredient in Ingredient.objects.filter(pk__in=missing):
+            entries[ingredient.pk] = (ingredient, entries[ingredient.pk][1])
+    return sorted((
+        {
+            'ingredient__name': entry.name,
+            'ingredient__measurement_unit': entry.measurement_unit,
+            'amount': amount,
+        }
+        for entry, amount in entries.values()
+    ), key=lambda row: row['ingredient__name'])
+
+
+def to_txt(rows):
+    yield 'Список покупок:\n'
+    for row in rows:
+        yield (
+            f'{row["ingredient__name"]}: {row["amount"]}, '
+            f'{row["ingredient__measurement_unit"]}\n'
+        )
+
+
+def to_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for row in rows:
+        yield writer.writerow((
+            row['ingredient__name'],
+            row['ingredient__measurement_unit'],
+            row['amount'],
+        ))
+
+
+def to_json(rows):
+    separator = '['
+    for row in rows:
+        yield separator + json.dumps({
+            'name': row['ingredient__name'],
+            'measurement_unit': row['ingredient__measurement_unit'],
+            'amount': row['amount'],
+        }, ensure_ascii=False)
+        separator = ','
+    yield '[]' if separator == '[' else ']'
+
+
+SHOPPING_LIST_FORMATS = {
+    'txt': (to_txt, 'text/plain; charset=utf-8'),
+    'csv': (to_csv, 'text/csv; charset=utf-8'),
+    'json': (to_json, 'application/json; charset=utf-8'),
+}
@@ -1,6 +1,10 @@
 from django_filters import ModelMultipleChoiceFilter
 from django_filters.rest_framework import FilterSet, filters
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import F, Q
 
 from recipes.models import Recipe, Tag
 
@@ -20,6 +24,29 @@ class RecipeFilter(FilterSet):
         queryset=Tag.objects.all(),
     )
 
+    search = filters.CharFilter(method='search_method')
+
+    def search_method(self, queryset, name, value):
+        """Полнотекстовый поиск по названию, ингредиентам и описанию.
+
+        В PostgreSQL результаты упорядочены по релевантности.
+        """
+        value = value.strip()
+        if not value:
+            return queryset
+        if connections[queryset.db].vendor != 'postgresql':
+            return queryset.filter(
+                Q(name__icontains=value) | Q(text__icontains=value)
+            )
+        query = SearchQuery(
+            value,
+            config=settings.RECIPE_SEARCH_CONFIG,
+            search_type='websearch',
+        )
+        return queryset.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F('search_vector'), query)
+        ).order_by('-search_rank', '-pub_date')
+
     def favorited_method(self, queryset, name, value):
         if value:
             user = self.request.user
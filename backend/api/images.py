@@ -0,0 +1,171 @@
+import base64
+import binascii
+import json
+import os
+import re
+import tempfile
+import uuid
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile, File
+from django.core.files.storage import default_storage
+from PIL import Image
+from rest_framework import exceptions
+
+# Размер порции base64, кратный 4, чтобы порции декодировались независимо.
+DECODE_CHUNK_SIZE = 64 * 1024
+
+# Символы вне алфавита base64 (переводы строк и т.п.): b64decode без
+# validate отбрасывает их, и при разбиении на порции они тоже удаляются
+# до выравнивания порции по 4 символа.
+NOT_BASE64 = re.compile(r'[^A-Za-z0-9+/=]')
+
+SAVE_OPTIONS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+    'jpeg': {'format': 'JPEG', 'quality': 82, 'optimize': True},
+}
+
+
+def decode_base64_image(data):
+    """Декодирует data:image/...;base64 порциями во временный файл.
+
+    Размеры изображения проверяются по заголовку файла, до того как
+    Django и Pillow попытаются прочитать его целиком.
+    """
+    header, _, encoded = data.partition(';base64,')
+    ext = header.split('/')[-1].lower()
+    if ext not in settings.IMAGE_ALLOWED_FORMATS:
+        raise exceptions.ValidationError(
+            f'Недопустимый формат изображения: {ext}'
+        )
+    upload = File(tempfile.TemporaryFile(), name=f'image.{ext}')
+    try:
+        decode_chunks(encoded, upload)
+        upload.size = upload.tell()
+        upload.seek(0)
+        validate_dimensions(upload)
+        upload.seek(0)
+    except Exception:
+        upload.close()
+        raise
+    return upload
+
+
+def decode_chunks(encoded, file):
+    """Пишет в file декодированную строку base64, порциями по 4n символов.
+
+    Остаток порции, не кратный 4, переносится в следующую.
+    """
+    pending = ''
+    try:
+        for start in range(0, len(encoded), DECODE_CHUNK_SIZE):
+            pending += NOT_BASE64.sub(
+                '', encoded[start:start + DECODE_CHUNK_SIZE]
+            )
+            usable = len(pending) - len(pending) % 4
+            file.write(base64.b64decode(pending[:usable]))
+            pending = pending[usable:]
+        file.write(base64.b64decode(pending))
+    except binascii.Error:
+        raise exceptions.ValidationError('Некорректная строка base64')
+
+
+def validate_dimensions(file):
+    try:
+        width, height = Image.open(file).size
+    except (OSError, Image.DecompressionBombError):
+        raise exceptions.ValidationError('Файл не является изображением')
+    if max(width, height) > settings.IMAGE_MAX_SIDE:
+        raise exceptions.ValidationError(
+            'Изображение больше '
+            f'{settings.IMAGE_MAX_SIDE}px по одной из сторон'
+        )
+
+
+def queue_dir(state):
+    path = os.path.join(settings.IMAGE_QUEUE_DIR, state)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def enqueue_variants(instance, field_name):
+    """Ставит задачу на нарезку вариантов изображения в очередь на диске."""
+    image = getattr(instance, field_name)
+    if not image:
+        return
+    job = {
+        'model': instance._meta.label,
+        'pk': instance.pk,
+        'field': field_name,
+        'name': image.name,
+    }
+    name = f'{uuid.uuid4().hex}.json'
+    temporary = os.path.join(queue_dir('tmp'), name)
+    with open(temporary, 'w', encoding='utf-8') as file:
+        json.dump(job, file)
+    os.replace(temporary, os.path.join(queue_dir('pending'), name))
+
+
+def claim_jobs(limit):
+    """Забирает задачи переименованием: оно атомарно между процессами."""
+    claimed = []
+    for name in sorted(os.listdir(queue_dir('pending')))[:limit]:
+        target = os.path.join(queue_dir('processing'), name)
+        try:
+            os.rename(os.path.join(queue_dir('pending'), name), target)
+        except FileNotFoundError:
+            continue
+        claimed.append(target)
+    return claimed
+
+
+def render_variants(name):
+    """Все размеры и форматы одного изображения: {размер: {формат: путь}}."""
+    base = os.path.splitext(name)[0]
+    variants = {}
+    with default_storage.open(name) as source:
+        image = Image.open(source)
+        image.load()
+    image = image.convert('RGB')
+    for size, side in settings.IMAGE_VARIANT_SIZES.items():
+        resized = image.copy()
+        resized.thumbnail((side, side), Image.LANCZOS)
+        variants[size] = {}
+        for ext, options in SAVE_OPTIONS.items():
+            content = ContentFile(b'')
+            resized.save(content, **options)
+            path = default_storage.save(
+                f'variants/{base}/{size}.{ext}', content
+            )
+            variants[size][ext] = path
+    return variants
+
+
+def process_job(path):
+    """Выполняет задачу и записывает пути вариантов в модель."""
+    with open(path, encoding='utf-8') as file:
+        job = json.load(file)
+    model = apps.get_model(job['model'])
+    instance = model.objects.filter(pk=job['pk']).first()
+    if (
+        instance is not None
+        and getattr(instance, job['field']).name == job['name']
+    ):
+        variants_field = f'{job["field"]}_variants'
+        setattr(instance, variants_field, render_variants(job['name']))
+        instance.save(update_fields=(variants_field,))
+    os.remove(path)
+    return job
+
+
+def variant_urls(variants, request=None):
+    urls = {}
+    for size, formats in (variants or {}).items():
+        urls[size] = {}
+        for ext, path in formats.items():
+            url = default_storage.url(path)
+            urls[size][ext] = (
+                request.build_absolute_uri(url) if request else url
+            )
+    return urls
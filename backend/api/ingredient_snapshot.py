@@ -0,0 +1,270 @@
+import mmap
+import os
+import struct
+import tempfile
+import time
+from bisect import bisect_left
+from collections import namedtuple
+
+from django.conf import settings
+
+from recipes.models import Ingredient
+from .cache import new_version
+
+# Файл снимка справочника ингредиентов:
+#   заголовок - сигнатура, версия формата, число строк, версия снимка;
+#   ids       - id ингредиентов по возрастанию, int64;
+#   spans     - начало названия, начало и конец единицы измерения
+#               в strings для каждой строки, 3 x uint32;
+#   by_name   - номера строк в порядке названий без учёта регистра, uint32;
+#   strings   - названия и единицы измерения в UTF-8.
+MAGIC = b'FGIS'
+FORMAT = 1
+HEADER = struct.Struct('<4sII52s')
+
+IngredientEntry = namedtuple('IngredientEntry', 'name measurement_unit')
+
+
+class IngredientSnapshot:
+    """Справочник ингредиентов только для чтения поверх буфера (mmap).
+
+    Данные не копируются в память процесса: воркеры, отобразившие
+    один файл, делят его страницы в кеше ОС.
+    """
+
+    def __init__(self, buffer):
+        magic, file_format, count, version = HEADER.unpack_from(buffer)
+        if magic != MAGIC or file_format != FORMAT:
+            raise ValueError('Неизвестный формат снимка ингредиентов')
+        self.version = version.rstrip(b'\0').decode()
+        view = memoryview(buffer)
+        offset = HEADER.size
+        self.ids = view[offset:offset + 8 * count].cast('q')
+        offset += 8 * count
+        self.spans = view[offset:offset + 12 * count].cast('I')
+        offset += 12 * count
+        self.by_name = view[offset:offset + 4 * count].cast('I')
+        self.strings = view[offset + 4 * count:]
+        self.keys = NameKeys(self)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def entry(self, row):
+        name_start, unit_start, unit_end = self.spans[3 * row:3 * row + 3]
+        return IngredientEntry(
+            str(self.strings[name_start:unit_start], 'utf-8'),
+            str(self.strings[unit_start:unit_end], 'utf-8'),
+        )
+
+    def get(self, pk):
+        """Название и единица измерения по id или None."""
+        row = bisect_left(self.ids, pk)
+        if row < len(self.ids) and self.ids[row] == pk:
+            return self.entry(row)
+        return None
+
+    def get_object(self, pk):
+        entry = self.get(pk)
+        if entry is None:
+            return None
+        return self.to_object(pk, entry)
+
+    def to_object(self, pk, entry):
+        return Ingredient.from_db(
+            None, ('id', 'name', 'measurement_unit'), (pk, *entry)
+        )
+
+    def objects(self, rows):
+        for row in rows:
+            yield self.to_object(self.ids[row], self.entry(row))
+
+    def rows(self):
+        """Строки для ответа списком, в порядке названий."""
+        return [
+            {'id': self.ids[row], **self.entry(row)._asdict()}
+            for row in self.by_name
+        ]
+
+    def prefix(self, query):
+        """Ингредиенты с названием, начинающимся с query."""
+        query = query.lower()
+        position = bisect_left(self.keys, query)
+        while (
+            position < len(self.keys)
+            and self.keys[position].startswith(query)
+        ):
+            yield self.by_name[position]
+            position += 1
+
+    def search(self, query, limit):
+        """Сначала совпадения по префиксу, затем по подстроке."""
+        found = []
+        for row in self.prefix(query):
+            found.append(row)
+            if len(found) == limit:
+                return list(self.objects(found))
+        query = query.lower()
+        for position, row in enumerate(self.by_name):
+            key = self.keys[position]
+            if query in key and not key.startswith(query):
+                found.append(row)
+                if len(found) == limit:
+                    break
+        return list(self.objects(found))
+
+
+class NameKeys:
+    """Названия в нижнем регистре в порядке by_name, для bisect."""
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+
+    def __len__(self):
+        return len(self.snapshot)
+
+    def __getitem__(self, position):
+        row = self.snapshot.by_name[position]
+        return self.snapshot.entry(row).name.lower()
+
+
+def write_snapshot(path, ingredients):
+    """Записывает снимок из пар (id, название, единица) по возрастанию id.
+
+    Файл заменяется атомарно: воркеры видят либо старый снимок целиком,
+    либо новый.
+    """
+    ids = []
+    spans = []
+    strings = bytearray()
+    names = []
+    for pk, name, measurement_unit in ingredients:
+        encoded_name = name.encode()
+        encoded_unit = measurement_unit.encode()
+        name_start = len(strings)
+        strings += encoded_name
+        unit_start = len(strings)
+        strings += encoded_unit
+        spans += (name_start, unit_start, len(strings))
+        names.append((name.lower(), pk, len(ids)))
+        ids.append(pk)
+    by_name = [row for _, _, row in sorted(names)]
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with tempfile.NamedTemporaryFile(
+        dir=directory, prefix='.ingredients-', delete=False
+    ) as file:
+        file.write(HEADER.pack(
+            MAGIC, FORMAT, len(ids), new_version().encode()
+        ))
+        file.write(struct.pack(f'<{len(ids)}q', *ids))
+        file.write(struct.pack(f'<{len(spans)}I', *spans))
+        file.write(struct.pack(f'<{len(by_name)}I', *by_name))
+        file.write(strings)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(file.name, path)
+    return len(ids)
+
+
+def build_snapshot():
+    """Пересборка снимка. Отметка об устаревании снимается до чтения
+    базы: изменение, зафиксированное во время сборки, поставит её снова.
+    """
+    snapshot_file.clear_stale()
+    count = write_snapshot(
+        settings.INGREDIENT_SNAPSHOT_PATH,
+        Ingredient.objects.order_by('id').values_list(
+            'id', 'name', 'measurement_unit'
+        ).iterator(),
+    )
+    snapshot_file.expire()
+    return count
+
+
+class SnapshotFile:
+    """Отображённый в память снимок, перечитываемый при замене файла.
+
+    Признак замены - inode, время изменения и размер файла; он
+    проверяется не чаще раза в INGREDIENT_SNAPSHOT_CHECK_INTERVAL
+    секунд. Запросы, получившие прежний снимок, дочитывают его:
+    старое отображение освобождается, когда на него не остаётся ссылок.
+
+    Рядом со снимком, отставшим от базы, лежит файл-отметка .stale:
+    пока снимок не пересобран, он не используется.
+    """
+
+    def __init__(self):
+        self.snapshot = None
+        self.marker = None
+        self.checked_at = None
+
+    def get(self):
+        now = time.monotonic()
+        if (
+            self.checked_at is None
+            or now - self.checked_at
+            >= settings.INGREDIENT_SNAPSHOT_CHECK_INTERVAL
+        ):
+            self.checked_at = now
+            self.reload()
+        return self.snapshot
+
+    def reload(self):
+        path = settings.INGREDIENT_SNAPSHOT_PATH
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            self.snapshot = self.marker = None
+            return
+        if os.path.exists(self.stale_path()):
+            self.snapshot = self.marker = None
+            return
+        marker = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if marker == self.marker:
+            return
+        with open(path, 'rb') as file:
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.snapshot = IngredientSnapshot(buffer)
+        self.marker = marker
+
+    def expire(self):
+        """Проверить файл при следующем обращении, не дожидаясь интервала."""
+        self.checked_at = None
+
+    def exists(self):
+        return os.path.exists(settings.INGREDIENT_SNAPSHOT_PATH)
+
+    def stale_path(self):
+        return settings.INGREDIENT_SNAPSHOT_PATH + '.stale'
+
+    def is_stale(self):
+        return os.path.exists(self.stale_path())
+
+    def mark_stale(self):
+        """Отметка для всех воркеров: снимок отстал от базы."""
+        if self.exists():
+            open(self.stale_path(), 'a').close()
+            self.expire()
+
+    def clear_stale(self):
+        try:
+            os.remove(self.stale_path())
+        except FileNotFoundError:
+            pass
+
+
+snapshot_file = SnapshotFile()
+
+
+def get_snapshot():
+    """Текущий снимок справочника ингредиентов или None, если он не
+    построен командой build_ingredient_snapshot или устарел.
+    """
+    return snapshot_file.get()
+
+
+def lookup_ingredient(pk):
+    snapshot = get_snapshot()
+    return None if snapshot is None else snapshot.get(pk)
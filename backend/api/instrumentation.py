@@ -0,0 +1,208 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+class RequestMetrics:
+    """SQL-запросы и время этапов обработки одного запроса.
+
+    Время запросов к базе входит и во время представления, и во время
+    сериализации: этапы не складываются в общее время.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.action = None
+        self.queries = 0
+        self.db = 0.0
+        self.view = 0.0
+        self.serialize = 0.0
+        self.threads = set()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db += time.perf_counter() - started
+
+    @contextmanager
+    def capture(self):
+        """Счёт запросов соединений текущего потока.
+
+        Соединения у каждого потока свои, поэтому код запроса, вынесенный
+        в другой поток, оборачивается в capture заново. Повторный вход
+        в том же потоке ничего не меняет, запросы не считаются дважды.
+        """
+        thread = threading.get_ident()
+        if thread in self.threads:
+            yield
+            return
+        self.threads.add(thread)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(self))
+                yield
+        finally:
+            self.threads.discard(thread)
+
+    @contextmanager
+    def timing(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            setattr(
+                self, stage,
+                getattr(self, stage) + time.perf_counter() - started,
+            )
+
+    @property
+    def total(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self):
+        return ', '.join((
+            f'db;dur={self.db * 1000:.1f};desc="{self.queries} queries"',
+            f'view;dur={self.view * 1000:.1f}',
+            f'serialize;dur={self.serialize * 1000:.1f}',
+            f'total;dur={self.total * 1000:.1f}',
+        ))
+
+    def as_dict(self, request, response):
+        return {
+            'action': self.action,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': self.queries,
+            'db_ms': round(self.db * 1000, 1),
+            'view_ms': round(self.view * 1000, 1),
+            'serialize_ms': round(self.serialize * 1000, 1),
+            'total_ms': round(self.total * 1000, 1),
+        }
+
+
+def get_metrics(request):
+    return getattr(request, 'metrics', None)
+
+
+class InstrumentationMiddleware:
+    """Считает запросы к базе и время обработки каждого запроса.
+
+    Итоги уходят в заголовок Server-Timing и в журнал одной строкой
+    JSON уровня DEBUG. Если запросов больше бюджета действия
+    (REQUEST_QUERY_BUDGETS) или общего REQUEST_QUERY_BUDGET, строка
+    пишется как предупреждение.
+    Для потоковых ответов запросы считаются до конца передачи тела,
+    а в заголовок попадает только то, что выполнено до его отправки.
+
+    Под ASGI цепочка обработки асинхронная и синхронный код запроса
+    выполняется в других потоках: там запросы считают сами
+    представления (InstrumentedViewMixin и api.async_views).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Так Django распознаёт асинхронный middleware-объект.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        metrics = request.metrics = RequestMetrics()
+        with metrics.capture():
+            response = self.get_response(request)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = request.metrics = RequestMetrics()
+        response = await self.get_response(request)
+        return self.finish(request, response, metrics)
+
+    def finish(self, request, response, metrics):
+        if metrics.action is None and request.resolver_match is not None:
+            metrics.action = request.resolver_match.view_name
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = metrics.server_timing()
+        if response.streaming:
+            response.streaming_content = self.stream(
+                response.streaming_content, request, response, metrics
+            )
+        else:
+            self.log(request, response, metrics)
+        return response
+
+    def stream(self, content, request, response, metrics):
+        try:
+            with metrics.capture():
+                yield from content
+        finally:
+            self.log(request, response, metrics)
+
+    def log(self, request, response, metrics):
+        record = metrics.as_dict(request, response)
+        budget = settings.REQUEST_QUERY_BUDGETS.get(
+            metrics.action, settings.REQUEST_QUERY_BUDGET
+        )
+        if metrics.queries > budget:
+            record['query_budget'] = budget
+            logger.warning(json.dumps(record, ensure_ascii=False))
+        elif logger.isEnabledFor(logging.DEBUG):
+            logger.debug(json.dumps(record, ensure_ascii=False))
+
+
+class InstrumentedViewMixin:
+    """Имя действия вьюсета и время представления и сериализации.
+
+    Сериализацией считается всё от первого вызова get_serializer
+    для вывода (без data=) до finalize_response. Сериализаторы входных
+    данных относятся к представлению: проверка и запись в базу - его
+    работа, как и вывод после неё.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        metrics = get_metrics(request)
+        if metrics is None:
+            return super().dispatch(request, *args, **kwargs)
+        with metrics.capture():
+            return super().dispatch(request, *args, **kwargs)
+
+    def initial(self, request, *args, **kwargs):
+        metrics = get_metrics(request)
+        if metrics is not None:
+            metrics.action = f'{self.__class__.__name__}.{self.action}'
+            self.view_started = time.perf_counter()
+        super().initial(request, *args, **kwargs)
+
+    def get_serializer(self, *args, **kwargs):
+        if (
+            'data' not in kwargs
+            and hasattr(self, 'view_started')
+            and not hasattr(self, 'serialize_started')
+        ):
+            self.serialize_started = time.perf_counter()
+        return super().get_serializer(*args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        metrics = get_metrics(request)
+        if metrics is not None and hasattr(self, 'view_started'):
+            finished = time.perf_counter()
+            serialize_started = getattr(self, 'serialize_started', finished)
+            metrics.view += serialize_started - self.view_started
+            metrics.serialize += finished - serialize_started
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -0,0 +1,246 @@
+import logging
+import statistics
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, reset_queries
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.short_links import encode
+from recipes.models import Tag, Ingredient, Recipe
+
+from .seed_benchmark_data import BENCHMARK_PREFIX
+
+User = get_user_model()
+
+# 1x1 PNG для создания рецептов.
+PIXEL = (
+    'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABAQMAAAAl21bKAAAAA1BMVEUAAACnej3aAAAAAX'
+    'RSTlMAQObYZgAAAApJREFUCNdjYAAAAAIAAeIhvDMAAAAASUVORK5CYII='
+)
+
+
+def percentile(values, percent):
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100)[percent - 1]
+
+
+def query_budget(response):
+    """Бюджет действия, обработавшего запрос (REQUEST_QUERY_BUDGETS)."""
+    metrics = getattr(response.wsgi_request, 'metrics', None)
+    action = metrics.action if metrics is not None else None
+    return action, settings.REQUEST_QUERY_BUDGETS.get(
+        action, settings.REQUEST_QUERY_BUDGET
+    )
+
+
+class Command(BaseCommand):
+    """Замер количества запросов и задержек для маршрутов API.
+
+    Запросы идут с настоящим токеном, как у клиентов, и сверяются с теми
+    же бюджетами действий, по которым журнал запросов пишет
+    предупреждения.
+    """
+
+    help = 'Нагрузочные замеры маршрутов API с проверкой бюджетов запросов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument(
+            '--route',
+            action='append',
+            dest='routes',
+            help='Замерить только указанные маршруты.',
+        )
+        parser.add_argument(
+            '--max-p95',
+            type=float,
+            default=None,
+            help='Допустимая задержка p95 в миллисекундах.',
+        )
+        parser.add_argument(
+            '--email',
+            default=None,
+            help='Пользователь, от имени которого выполняются запросы.',
+        )
+
+    def handle(self, *args, **options):
+        user = self.get_user(options['email'])
+        token, _ = Token.objects.get_or_create(user=user)
+        client = APIClient(HTTP_HOST='localhost')
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        anonymous = APIClient(HTTP_HOST='localhost')
+        self.client = client
+
+        routes = self.get_routes(client, anonymous)
+        if options['routes']:
+            routes = {
+                name: route for name, route in routes.items()
+                if name in options['routes']
+            }
+
+        failures = []
+        self.stdout.write(
+            f'{"маршрут":<26}{"запросы":>9}{"бюджет":>8}'
+            f'{"p50, мс":>10}{"p95, мс":>10}{"зап./с":>10}'
+        )
+        logger = logging.getLogger('api.instrumentation')
+        level = logger.level
+        # Строки журнала о каждом запросе смешались бы с таблицей.
+        logger.setLevel(logging.ERROR)
+        try:
+            for name, request in routes.items():
+                failures += self.report(name, request, options)
+        finally:
+            logger.setLevel(level)
+
+        if failures:
+            raise CommandError(
+                'Превышены бюджеты:\n' + '\n'.join(failures)
+            )
+        self.stdout.write(self.style.SUCCESS('Все бюджеты соблюдены'))
+
+    def report(self, name, request, options):
+        """Строка таблицы для маршрута и список превышений бюджетов."""
+        queries, timings, response = self.measure(request, options['repeat'])
+        action, budget = query_budget(response)
+        p50 = percentile(timings, 50)
+        p95 = percentile(timings, 95)
+        throughput = len(timings) * 1000 / sum(timings)
+        self.stdout.write(
+            f'{name:<26}{queries:>9}{budget:>8}'
+            f'{p50:>10.1f}{p95:>10.1f}{throughput:>10.0f}'
+        )
+        failures = []
+        if queries > budget:
+            failures.append(
+                f'{name} ({action}): {queries} запросов > {budget}'
+            )
+        if options['max_p95'] is not None and p95 > options['max_p95']:
+            failures.append(
+                f'{name}: p95 {p95:.1f} мс > {options["max_p95"]} мс'
+            )
+        return failures
+
+    def get_user(self, email):
+        users = User.objects.order_by('id')
+        if email:
+            user = users.filter(email=email).first()
+        else:
+            user = users.filter(username__startswith=BENCHMARK_PREFIX).first()
+        if user is None:
+            raise CommandError(
+                'Нет пользователя для замеров, выполните seed_benchmark_data'
+            )
+        return user
+
+    def get_routes(self, client, anonymous):
+        recipe = Recipe.objects.order_by('-pub_date').first()
+        tag = Tag.objects.first()
+        ingredients = list(Ingredient.objects.values_list('id', flat=True)[:3])
+        if recipe is None or tag is None or not ingredients:
+            raise CommandError(
+                'Нет рецептов для замеров, выполните seed_benchmark_data'
+            )
+        code = encode(recipe.id)
+        # Ингредиенты рецепта: подбор по ним находит хотя бы его.
+        recipe_ingredients = list(recipe.recipe_ingredients.values_list(
+            'ingredient_id', flat=True
+        ))
+        created = []
+
+        def create_recipe():
+            response = client.post('/api/recipes/', {
+                'name': f'{BENCHMARK_PREFIX} замер',
+                'text': 'Рецепт, созданный benchmark_api.',
+                'cooking_time': 10,
+                'image': f'data:image/png;base64,{PIXEL}',
+                'tags': [tag.id],
+                'ingredients': [
+                    {'id': ingredient, 'amount': 10}
+                    for ingredient in ingredients
+                ],
+            }, format='json')
+            if response.status_code == 201:
+                created.append(response.data['id'])
+            return response
+
+        self.created = created
+        return {
+            'recipes-list-anonymous': lambda: anonymous.get(
+                '/api/recipes/?limit=6'
+            ),
+            'recipes-list': lambda: client.get('/api/recipes/?limit=6'),
+            'recipes-list-filtered': lambda: client.get(
+                f'/api/recipes/?limit=6&is_favorited=1&tags={tag.slug}'
+            ),
+            'recipes-detail': lambda: client.get(
+                f'/api/recipes/{recipe.id}/'
+            ),
+            'recipes-trending': lambda: client.get(
+                f'/api/recipes/trending/?limit=6&tags={tag.slug}'
+            ),
+            'recipes-by-ingredients': lambda: client.get(
+                '/api/recipes/by_ingredients/?match=missing&max_missing=2'
+                f'&ingredients={",".join(map(str, recipe_ingredients))}'
+            ),
+            'recipes-create': create_recipe,
+            'recipes-get-link': lambda: client.get(
+                f'/api/recipes/{recipe.id}/get-link/'
+            ),
+            'short-link-redirect': lambda: anonymous.get(f'/s/{code}'),
+            'subscriptions': lambda: client.get(
+                '/api/users/subscriptions/?recipes_limit=3'
+            ),
+            'download-shopping-cart': lambda: client.get(
+                '/api/recipes/download_shopping_cart/'
+            ),
+            'ingredients-search': lambda: client.get(
+                f'/api/ingredients/?name={BENCHMARK_PREFIX}'
+            ),
+            'tags-list': lambda: client.get('/api/tags/'),
+            'users-list': lambda: client.get('/api/users/?limit=6'),
+            'users-me': lambda: client.get('/api/users/me/'),
+        }
+
+    def measure(self, request, repeat):
+        """Число запросов последнего вызова, задержки всех вызовов в мс
+        и ответ последнего вызова.
+        """
+        request()
+        timings = []
+        try:
+            for _ in range(repeat):
+                # Журнал запросов ограничен 9000 записями: заполненный,
+                # он перестаёт расти, и замер показал бы 0 запросов.
+                reset_queries()
+                # Запросы ко всем базам, включая реплики для чтения.
+                with ExitStack() as stack:
+                    captured = [
+                        stack.enter_context(CaptureQueriesContext(db))
+                        for db in connections.all()
+                    ]
+                    started = time.perf_counter()
+                    response = request()
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+                    timings.append((time.perf_counter() - started) * 1000)
+                queries = sum(len(context) for context in captured)
+                if response.status_code >= 400:
+                    raise CommandError(
+                        f'{response.request["PATH_INFO"]}: '
+                        f'{response.status_code}'
+                    )
+        finally:
+            # Удаление тем же путём API, что и создание: счётчики
+            # и кеши меняются так же.
+            for recipe_id in self.created:
+                self.client.delete(f'/api/recipes/{recipe_id}/')
+            self.created.clear()
+        return queries, timings, response
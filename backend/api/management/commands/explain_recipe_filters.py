@@ -0,0 +1,115 @@
+import itertools
+import re
+from types import SimpleNamespace
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.http import QueryDict
+
+from api.filters import RecipeFilter
+from recipes.models import Favorite, Recipe, Tag
+
+User = get_user_model()
+
+FILTERS = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
+
+# Полный проход по таблице в плане PostgreSQL и SQLite.
+SEQ_SCAN = {
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+    'sqlite': re.compile(r'SCAN (?:TABLE )?(\w+)$', re.MULTILINE),
+}
+
+
+class Command(BaseCommand):
+    """Планы запросов ленты для всех сочетаний фильтров RecipeFilter."""
+
+    help = (
+        'EXPLAIN ANALYZE для сочетаний фильтров ленты рецептов '
+        'с поиском полных проходов по таблицам'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--email',
+            default=None,
+            help='Пользователь для фильтров избранного и списка покупок.',
+        )
+        parser.add_argument('--limit', type=int, default=6)
+        parser.add_argument(
+            '--verbose-plans',
+            action='store_true',
+            help='Выводить планы целиком.',
+        )
+        parser.add_argument(
+            '--fail-on-seq-scan',
+            action='store_true',
+            help='Завершаться с ошибкой, если найден полный проход.',
+        )
+
+    def handle(self, *args, **options):
+        pattern = SEQ_SCAN.get(connection.vendor)
+        if pattern is None:
+            raise CommandError(
+                f'База {connection.vendor} не поддерживается'
+            )
+        user = self.get_user(options['email'])
+        values = self.get_values()
+        explain_options = (
+            {'analyze': True} if connection.vendor == 'postgresql' else {}
+        )
+
+        found = []
+        for size in range(len(FILTERS) + 1):
+            for combination in itertools.combinations(FILTERS, size):
+                data = QueryDict(mutable=True)
+                for name in combination:
+                    data[name] = values[name]
+                queryset = RecipeFilter(
+                    data,
+                    queryset=Recipe.objects.all(),
+                    request=SimpleNamespace(user=user),
+                ).qs[:options['limit']]
+                plan = queryset.explain(**explain_options)
+                scans = sorted(set(pattern.findall(plan)))
+                title = ' + '.join(combination) or 'без фильтров'
+                if scans:
+                    found.append(title)
+                    self.stdout.write(self.style.WARNING(
+                        f'{title}: полный проход по {", ".join(scans)}'
+                    ))
+                else:
+                    self.stdout.write(f'{title}: индексы')
+                if options['verbose_plans']:
+                    self.stdout.write(plan + '\n')
+
+        if found and options['fail_on_seq_scan']:
+            raise CommandError(
+                f'Полные проходы в {len(found)} сочетаниях фильтров'
+            )
+
+    def get_user(self, email):
+        if email:
+            user = User.objects.filter(email=email).first()
+        else:
+            favorite = Favorite.objects.select_related('user').first()
+            user = favorite.user if favorite else None
+        if user is None:
+            raise CommandError(
+                'Нет данных для замеров, выполните seed_benchmark_data'
+            )
+        return user
+
+    def get_values(self):
+        author = Recipe.objects.values_list('author', flat=True).first()
+        tag = Tag.objects.filter(recipes__isnull=False).first()
+        if author is None or tag is None:
+            raise CommandError(
+                'Нет данных для замеров, выполните seed_benchmark_data'
+            )
+        return {
+            'author': str(author),
+            'tags': tag.slug,
+            'is_favorited': '1',
+            'is_in_shopping_cart': '1',
+        }
@@ -0,0 +1,132 @@
+import http.client
+import json
+import threading
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.short_links import encode
+
+from .benchmark_api import percentile
+
+ROUTES = (
+    'recipes-list', 'recipes-detail', 'tags-list', 'ingredients-list',
+    'short-link',
+)
+
+
+class Command(BaseCommand):
+    """Нагрузочный тест запущенных серверов, например gunicorn с
+    синхронными воркерами и ASGI-воркерами uvicorn при одинаковом числе
+    воркеров. Запросы идут по HTTP из нескольких потоков одновременно.
+    """
+
+    help = 'Нагрузочный тест чтения API на одном или нескольких серверах'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url',
+            action='append',
+            required=True,
+            help='Адрес сервера, можно указать несколько для сравнения.',
+        )
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument(
+            '--duration', type=float, default=10,
+            help='Секунд нагрузки на каждый маршрут.',
+        )
+        parser.add_argument(
+            '--token', help='Токен пользователя для запросов с авторизацией.'
+        )
+        parser.add_argument(
+            '--routes', nargs='*', choices=ROUTES,
+            help='Только перечисленные маршруты.',
+        )
+
+    def handle(self, *args, **options):
+        self.headers = {'Accept': 'application/json'}
+        if options['token']:
+            self.headers['Authorization'] = f'Token {options["token"]}'
+        self.stdout.write(
+            f'{"сервер":<28}{"маршрут":<18}{"зап./с":>9}'
+            f'{"p50, мс":>10}{"p95, мс":>10}{"ошибки":>8}'
+        )
+        for url in options['url']:
+            routes = self.get_routes(url)
+            for name in options['routes'] or ROUTES:
+                latencies, errors = self.load(
+                    url, routes[name],
+                    options['concurrency'], options['duration'],
+                )
+                if not latencies:
+                    raise CommandError(f'{url}: {name} не ответил ни разу')
+                self.stdout.write(
+                    f'{url:<28}{name:<18}'
+                    f'{len(latencies) / options["duration"]:>9.0f}'
+                    f'{percentile(latencies, 50):>10.1f}'
+                    f'{percentile(latencies, 95):>10.1f}{errors:>8}'
+                )
+
+    def get_routes(self, url):
+        status, body = self.request(
+            self.connect(url), '/api/recipes/?limit=1'
+        )
+        results = json.loads(body).get('results') if status == 200 else None
+        if not results:
+            raise CommandError(f'{url}: нет рецептов для нагрузки')
+        recipe_id = results[0]['id']
+        return {
+            'recipes-list': '/api/recipes/?limit=6',
+            'recipes-detail': f'/api/recipes/{recipe_id}/',
+            'tags-list': '/api/tags/',
+            'ingredients-list': '/api/ingredients/',
+            'short-link': f'/s/{encode(recipe_id)}',
+        }
+
+    def load(self, url, path, concurrency, duration):
+        """Задержки успешных запросов в мс и число ошибок."""
+        latencies = []
+        errors = 0
+        lock = threading.Lock()
+        deadline = time.monotonic() + duration
+
+        def worker():
+            nonlocal errors
+            connection = self.connect(url)
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                try:
+                    status, _ = self.request(connection, path)
+                except (OSError, http.client.HTTPException):
+                    connection.close()
+                    status = None
+                elapsed = (time.perf_counter() - started) * 1000
+                with lock:
+                    if status is not None and status < 400:
+                        latencies.append(elapsed)
+                    else:
+                        errors += 1
+            connection.close()
+
+        threads = [
+            threading.Thread(target=worker) for _ in range(concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return latencies, errors
+
+    def connect(self, url):
+        parts = urlsplit(url)
+        connection_class = (
+            http.client.HTTPSConnection if parts.scheme == 'https'
+            else http.client.HTTPConnection
+        )
+        return connection_class(parts.netloc, timeout=30)
+
+    def request(self, connection, path):
+        connection.request('GET', path, headers=self.headers)
+        response = connection.getresponse()
+        return response.status, response.read()
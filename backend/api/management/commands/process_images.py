@@ -0,0 +1,55 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api.images import claim_jobs, process_job, queue_dir
+
+
+class Command(BaseCommand):
+    """Обработчик очереди уменьшенных копий изображений."""
+
+    help = 'Нарезка уменьшенных копий загруженных изображений'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=1.0,
+            help='Пауза между проверками пустой очереди, в секундах.',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Обработать текущую очередь и завершиться.',
+        )
+
+    def handle(self, *args, **options):
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            while True:
+                jobs = claim_jobs(options['workers'] * 4)
+                if not jobs:
+                    if options['once']:
+                        break
+                    time.sleep(options['interval'])
+                    continue
+                for result in pool.map(self.run, jobs):
+                    if result is not None:
+                        self.stdout.write(
+                            f'{result["model"]} {result["pk"]}: '
+                            f'{result["name"]}'
+                        )
+
+    def run(self, path):
+        try:
+            return process_job(path)
+        except Exception as error:
+            self.stderr.write(f'{os.path.basename(path)}: {error}')
+            os.replace(
+                path, os.path.join(queue_dir('failed'), os.path.basename(path))
+            )
+        finally:
+            close_old_connections()
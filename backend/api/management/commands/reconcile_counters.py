@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from api.counters import COUNTERS, actual_count
+
+
+class Command(BaseCommand):
+    """Сверка денормализованных счётчиков с фактическими связями."""
+
+    help = 'Исправление расхождений в счётчиках подписок и избранного'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5_000)
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать число расхождений.',
+        )
+
+    def handle(self, *args, **options):
+        self.dry_run = options['dry_run']
+        for counter in COUNTERS:
+            model, field, related, foreign_key = counter
+            drifted = model.objects.annotate(
+                actual=actual_count(related, foreign_key)
+            ).exclude(**{field: F('actual')}).order_by()
+            fixed = 0
+            batch = []
+            for pk in drifted.values_list('pk', flat=True).iterator():
+                batch.append(pk)
+                if len(batch) == options['batch_size']:
+                    fixed += self.fix(counter, batch)
+                    batch = []
+            fixed += self.fix(counter, batch)
+            self.stdout.write(
+                f'{model.__name__}.{field}: расхождений {fixed}'
+            )
+
+    def fix(self, counter, pks):
+        """Значение пересчитывается в самом UPDATE: изменения, сделанные
+        после выборки расхождений, не затираются.
+        """
+        model, field, related, foreign_key = counter
+        if pks and not self.dry_run:
+            model.objects.filter(pk__in=pks).update(
+                **{field: actual_count(related, foreign_key)}
+            )
+        return len(pks)
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.trending import refresh_trending
+
+
+class Command(BaseCommand):
+    """Пересчёт рейтинга популярных рецептов."""
+
+    help = 'Пересчёт популярных рецептов за окно TRENDING_WINDOW_DAYS'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Пересчитать всё окно, а не только изменившиеся рецепты.',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        refreshed = refresh_trending(
+            full=options['full'], batch_size=options['batch_size']
+        )
+        self.stdout.write(
+            f'Пересчитано рецептов: {refreshed} '
+            f'за {time.perf_counter() - started:.2f} с'
+        )
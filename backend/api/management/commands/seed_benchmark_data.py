@@ -0,0 +1,234 @@
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from api.cache import bump_version
+from api.catalog import CATALOGS
+from api.response_cache import FEED
+from api.short_links import recipe_ids
+from recipes.models import (
+    Tag,
+    Ingredient,
+    Recipe,
+    RecipeIngredients,
+    Favorite,
+    ShoppingCart,
+)
+from users.models import Follow
+
+User = get_user_model()
+
+BENCHMARK_PREFIX = 'bench'
+
+
+class Command(BaseCommand):
+    """Наполнение базы синтетическими данными для нагрузочных замеров."""
+
+    help = 'Генерация синтетических данных для benchmark_api'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50_000)
+        parser.add_argument('--recipes', type=int, default=100_000)
+        parser.add_argument('--ingredients', type=int, default=2_000)
+        parser.add_argument('--tags', type=int, default=12)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--favorites', type=int, default=2_000_000)
+        parser.add_argument('--carts', type=int, default=200_000)
+        parser.add_argument('--follows', type=int, default=500_000)
+        parser.add_argument('--batch-size', type=int, default=5_000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument(
+            '--flush',
+            action='store_true',
+            help='Удалить ранее сгенерированные данные перед генерацией.',
+        )
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        if options['flush']:
+            self.flush()
+
+        started = time.perf_counter()
+        tag_ids = self.create_tags(options['tags'])
+        ingredient_ids = self.create_ingredients(options['ingredients'])
+        user_ids = self.create_users(options['users'])
+        recipe_ids = self.create_recipes(
+            options['recipes'], user_ids, tag_ids, ingredient_ids,
+            options['ingredients_per_recipe'],
+        )
+        self.create_pairs(
+            Favorite, 'user_id', 'recipe_id',
+            user_ids, recipe_ids, options['favorites'], timestamps=True,
+        )
+        self.create_pairs(
+            ShoppingCart, 'user_id', 'recipe_id',
+            user_ids, recipe_ids, options['carts'], timestamps=True,
+        )
+        self.create_pairs(
+            Follow, 'user_id', 'author_id',
+            user_ids, user_ids, options['follows'],
+        )
+        # bulk_create обходит пути записи, которые ведут счётчики
+        # и сбрасывают кеши.
+        self.invalidate_caches()
+        call_command('reconcile_counters', stdout=self.stdout)
+        call_command('refresh_trending', full=True, stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(
+            f'Данные сгенерированы за {time.perf_counter() - started:.1f} с'
+        ))
+
+    def invalidate_caches(self):
+        for catalog in CATALOGS.values():
+            catalog.invalidate()
+        recipe_ids.invalidate()
+        bump_version(FEED)
+
+    def flush(self):
+        with transaction.atomic():
+            Recipe.objects.filter(
+                author__username__startswith=BENCHMARK_PREFIX
+            ).delete()
+            User.objects.filter(
+                username__startswith=BENCHMARK_PREFIX
+            ).delete()
+            Ingredient.objects.filter(
+                name__startswith=BENCHMARK_PREFIX
+            ).delete()
+            Tag.objects.filter(slug__startswith=BENCHMARK_PREFIX).delete()
+
+    def bulk_create(self, model, objects, **kwargs):
+        model.objects.bulk_create(
+            objects, batch_size=self.batch_size, **kwargs
+        )
+        self.stdout.write(f'{model.__name__}: +{len(objects)}')
+
+    def create_tags(self, count):
+        self.bulk_create(Tag, [
+            Tag(
+                name=f'{BENCHMARK_PREFIX} тег {number}',
+                slug=f'{BENCHMARK_PREFIX}-{number}',
+            )
+            for number in range(count)
+        ], ignore_conflicts=True)
+        return list(
+            Tag.objects.filter(
+                slug__startswith=BENCHMARK_PREFIX
+            ).values_list('id', flat=True)
+        )
+
+    def create_ingredients(self, count):
+        self.bulk_create(Ingredient, [
+            Ingredient(
+                name=f'{BENCHMARK_PREFIX} ингредиент {number}',
+                measurement_unit=self.random.choice(('г', 'мл', 'шт.')),
+            )
+            for number in range(count)
+        ], ignore_conflicts=True)
+        return list(
+            Ingredient.objects.filter(
+                name__startswith=BENCHMARK_PREFIX
+            ).values_list('id', flat=True)
+        )
+
+    def create_users(self, count):
+        password = make_password(BENCHMARK_PREFIX)
+        self.bulk_create(User, [
+            User(
+                username=f'{BENCHMARK_PREFIX}{number}',
+                email=f'{BENCHMARK_PREFIX}{number}@example.com',
+                first_name='Бенч',
+                last_name=str(number),
+                password=password,
+            )
+            for number in range(count)
+        ], ignore_conflicts=True)
+        return list(
+            User.objects.filter(
+                username__startswith=BENCHMARK_PREFIX
+            ).order_by('id').values_list('id', flat=True)
+        )
+
+    def create_recipes(self, count, user_ids, tag_ids, ingredient_ids,
+                       per_recipe):
+        first_id = Recipe.objects.order_by('-id').values_list(
+            'id', flat=True
+        ).first() or 0
+        self.bulk_create(Recipe, [
+            Recipe(
+                author_id=self.random.choice(user_ids),
+                name=f'{BENCHMARK_PREFIX} рецепт {number}',
+                text='Синтетический рецепт для замеров.',
+                image='recipes/benchmark.png',
+                cooking_time=self.random.randint(1, 180),
+            )
+            for number in range(count)
+        ])
+        recipe_ids = list(
+            Recipe.objects.filter(
+                id__gt=first_id, name__startswith=BENCHMARK_PREFIX
+            ).values_list('id', flat=True)
+        )
+        self.bulk_create(Recipe.tags.through, [
+            Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in self.random.sample(
+                tag_ids, min(len(tag_ids), self.random.randint(1, 3))
+            )
+        ])
+        self.bulk_create(RecipeIngredients, [
+            RecipeIngredients(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_id,
+                amount=self.random.randint(1, 500),
+            )
+            for recipe_id in recipe_ids
+            for ingredient_id in self.random.sample(
+                ingredient_ids, min(len(ingredient_ids), per_recipe)
+            )
+        ])
+        Recipe.objects.filter(pk__in=recipe_ids).update_ingredient_ids()
+        return recipe_ids
+
+    def create_pairs(self, model, left, right, left_ids, right_ids, count,
+                     timestamps=False):
+        """Случайные уникальные пары (пользователь, объект).
+
+        Первый пользователь получает гарантированную долю связей, чтобы
+        замеры от его имени не работали с пустыми списками. С timestamps
+        даты связей разбросаны по последним 30 дням.
+        """
+        if not left_ids or not right_ids:
+            return
+        first_user = left_ids[0]
+        pairs = {
+            (first_user, right_id)
+            for right_id in self.random.sample(
+                right_ids, min(len(right_ids), 30)
+            )
+        }
+        attempts = count * 2
+        while len(pairs) < count and attempts:
+            attempts -= 1
+            pairs.add(
+                (self.random.choice(left_ids), self.random.choice(right_ids))
+            )
+        if model is Follow:
+            pairs = {pair for pair in pairs if pair[0] != pair[1]}
+        now = timezone.now()
+        extra = {}
+        objects = []
+        for left_id, right_id in pairs:
+            if timestamps:
+                extra['created'] = now - timedelta(
+                    seconds=self.random.randrange(30 * 24 * 3600)
+                )
+            objects.append(model(**{left: left_id, right: right_id}, **extra))
+        self.bulk_create(model, objects, ignore_conflicts=True)
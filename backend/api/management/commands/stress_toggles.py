@@ -0,0 +1,133 @@
+import logging
+import threading
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import F
+from rest_framework.test import APIClient
+
+from api.counters import COUNTERS, actual_count
+from recipes.models import Recipe
+
+from .seed_benchmark_data import BENCHMARK_PREFIX
+
+User = get_user_model()
+
+TOGGLES = ('favorite', 'shopping_cart', 'subscribe')
+
+
+class Command(BaseCommand):
+    """Проверка переключателей избранного, списка покупок и подписки
+    под одновременными запросами: один и тот же POST или DELETE
+    отправляется из многих потоков сразу, как при двойном клике.
+
+    Ровно один запрос должен изменить связь, остальные получить 400,
+    ни одного 500, а счётчики совпадать с фактическими связями.
+    """
+
+    help = 'Одновременные повторы добавления и удаления связей'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--rounds', type=int, default=5)
+        parser.add_argument(
+            '--toggles', nargs='*', choices=TOGGLES,
+            help='Только перечисленные переключатели.',
+        )
+
+    def handle(self, *args, **options):
+        logging.getLogger('api.instrumentation').setLevel(logging.ERROR)
+        users = list(User.objects.filter(
+            username__startswith=BENCHMARK_PREFIX
+        ).order_by('id')[:2])
+        recipe = Recipe.objects.order_by('id').first()
+        if len(users) < 2 or recipe is None:
+            raise CommandError(
+                'Нет данных для проверки, выполните seed_benchmark_data'
+            )
+        user, author = users
+        paths = {
+            'favorite': f'/api/recipes/{recipe.id}/favorite/',
+            'shopping_cart': f'/api/recipes/{recipe.id}/shopping_cart/',
+            'subscribe': f'/api/users/{author.id}/subscribe/',
+        }
+        counted = {Recipe: [recipe.id], User: [user.id, author.id]}
+
+        failures = []
+        for name in options['toggles'] or TOGGLES:
+            # Исходное состояние: связи нет. Ответ не важен.
+            self.send(user, 'delete', paths[name])
+            for round_number in range(1, options['rounds'] + 1):
+                for method, success in (('post', 201), ('delete', 204)):
+                    statuses = self.hammer(
+                        user, method, paths[name], options['threads']
+                    )
+                    summary = ', '.join(
+                        f'{result} x {count}'
+                        for result, count in sorted(
+                            statuses.items(), key=lambda item: str(item[0])
+                        )
+                    )
+                    label = f'{name} {method.upper()} #{round_number}'
+                    self.stdout.write(f'{label:<28}{summary}')
+                    unexpected = set(statuses) - {success, 400}
+                    if statuses[success] != 1 or unexpected:
+                        failures.append(f'{label}: {summary}')
+                    failures += [
+                        f'{label}: {drift}'
+                        for drift in self.counter_drift(counted)
+                    ]
+
+        if failures:
+            raise CommandError(
+                'Ошибки при одновременных запросах:\n' + '\n'.join(failures)
+            )
+        self.stdout.write(self.style.SUCCESS(
+            'Каждый раз связь изменил ровно один запрос'
+        ))
+
+    def send(self, user, method, path):
+        client = APIClient(HTTP_HOST='localhost')
+        client.force_authenticate(user)
+        return getattr(client, method)(path).status_code
+
+    def hammer(self, user, method, path, threads):
+        """Статусы ответов одновременных запросов: код или имя исключения."""
+        barrier = threading.Barrier(threads)
+        statuses = Counter()
+        lock = threading.Lock()
+
+        def worker():
+            try:
+                barrier.wait()
+                result = self.send(user, method, path)
+            except Exception as error:
+                result = type(error).__name__
+            finally:
+                connections.close_all()
+            with lock:
+                statuses[result] += 1
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return statuses
+
+    def counter_drift(self, counted):
+        for model, field, related, foreign_key in COUNTERS:
+            drifted = model.objects.filter(
+                pk__in=counted[model]
+            ).annotate(
+                actual=actual_count(related, foreign_key)
+            ).exclude(**{field: F('actual')}).values_list(
+                'pk', field, 'actual'
+            )
+            for pk, value, actual in drifted:
+                yield (
+                    f'{model.__name__} {pk}: {field} = {value}, '
+                    f'фактически {actual}'
+                )
@@ -1,5 +1,132 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (
+    CursorPagination,
+    PageNumberPagination,
+    _reverse_ordering,
+)
+
+
+def keyset_filter(ordering, position):
+    """Записи строго после position в порядке ordering.
+
+    Для ('-pub_date', '-id'): pub_date < p или pub_date = p и id < i.
+    """
+    condition = None
+    for field, value in reversed(list(zip(ordering, position))):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        after = Q(**{f'{name}__{lookup}': value})
+        condition = after if condition is None else (
+            after | Q(**{name: value}) & condition
+        )
+    return condition
+
+
+class LimitCursorPagination(CursorPagination):
+    """Курсор по значениям всех полей ordering, например (pub_date, id).
+
+    CursorPagination из DRF хранит в курсоре только первое поле и
+    различает записи с одинаковым значением смещением: при вставках
+    между запросами такие записи пропускались или повторялись. Здесь
+    последнее поле ordering уникально, поэтому позиция однозначна и
+    страница выбирается условием по ключу, без OFFSET.
+    """
+
+    page_size_query_param = 'limit'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            reverse, current_position = False, None
+        else:
+            _, reverse, current_position = self.cursor
+
+        ordering = (
+            _reverse_ordering(self.ordering) if reverse else self.ordering
+        )
+        queryset = queryset.order_by(*ordering)
+        if current_position is not None:
+            queryset = queryset.filter(keyset_filter(
+                ordering, self.parse_position(current_position)
+            ))
+
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        following_position = None
+        if len(results) > len(self.page):
+            following_position = self._get_position_from_instance(
+                results[-1], self.ordering
+            )
+
+        if reverse:
+            self.page = list(reversed(self.page))
+            self.has_next = current_position is not None
+            self.has_previous = following_position is not None
+            self.next_position = current_position
+            self.previous_position = following_position
+        else:
+            self.has_next = following_position is not None
+            self.has_previous = current_position is not None
+            self.next_position = following_position
+            self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def _get_position_from_instance(self, instance, ordering):
+        values = []
+        for field in ordering:
+            name = field.lstrip('-')
+            value = (
+                instance[name] if isinstance(instance, dict)
+                else getattr(instance, name)
+            )
+            values.append(str(value))
+        return json.dumps(values)
+
+    def parse_position(self, position):
+        try:
+            values = json.loads(position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return values
 
 
 class LimitPagination(PageNumberPagination):
+    """Номера страниц или курсор, если передан параметр cursor.
+
+    Курсорный режим доступен представлениям с атрибутом cursor_ordering:
+    он не считает COUNT(*) и не сдвигается OFFSET, а позиция страницы
+    не зависит от вставки новых записей в начало списка.
+    """
+
     page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        ordering = getattr(view, 'cursor_ordering', None)
+        self.cursor_paginator = None
+        if ordering and self.cursor_query_param in request.query_params:
+            self.cursor_paginator = LimitCursorPagination()
+            self.cursor_paginator.ordering = ordering
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
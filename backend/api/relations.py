@@ -0,0 +1,157 @@
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import CharField, Value
+from django.db.models.sql import InsertQuery
+
+from recipes.models import Favorite, ShoppingCart
+from users.models import Follow
+from .cache import bump_version, get_shared_cache, get_version
+from .db_router import read_from_primary
+
+# Вид связи: (модель, поле пользователя, поле связанного объекта).
+RELATIONS = {
+    'favorites': (Favorite, 'user_id', 'recipe_id'),
+    'shopping_cart': (ShoppingCart, 'user_id', 'recipe_id'),
+    'following': (Follow, 'user_id', 'author_id'),
+}
+
+
+class UserRelations:
+    """Отсортированные массивы id избранного, списка покупок и подписок
+    пользователя: флаги сериализаторов проверяются бинарным поиском.
+    """
+
+    def __init__(self, ids):
+        self.ids = ids
+
+    def contains(self, kind, pk):
+        ids = self.ids[kind]
+        position = bisect_left(ids, pk)
+        return position < len(ids) and ids[position] == pk
+
+
+def relations_version(user_id):
+    return f'users:{user_id}:relations'
+
+
+def load_relations(user_id):
+    """Все связи пользователя одним запросом UNION ALL."""
+    querysets = [
+        model.objects.filter(**{user_field: user_id}).annotate(
+            kind=Value(kind, output_field=CharField())
+        ).values_list('kind', field).order_by()
+        for kind, (model, user_field, field) in RELATIONS.items()
+    ]
+    ids = {kind: [] for kind in RELATIONS}
+    for kind, pk in querysets[0].union(*querysets[1:], all=True):
+        ids[kind].append(pk)
+    return UserRelations({
+        kind: array('q', sorted(pks)) for kind, pks in ids.items()
+    })
+
+
+def fetch_relations(user_id):
+    """Связи из общего кеша по текущей версии или из базы.
+
+    Без общего кеша версии не видны другим процессам, поэтому связи
+    загружаются заново в каждом запросе.
+    """
+    shared = get_shared_cache()
+    if shared is None:
+        return load_relations(user_id)
+    key = f'relations:{user_id}:{get_version(relations_version(user_id))}'
+    relations = shared.get(key)
+    if relations is None:
+        with read_from_primary():
+            relations = load_relations(user_id)
+        shared.set(key, relations, settings.USER_RELATIONS_CACHE_TIMEOUT)
+    return relations
+
+
+def get_user_relations(request):
+    """Связи текущего пользователя, один раз на запрос; None для анонима."""
+    if request is None or request.user.is_anonymous:
+        return None
+    relations = getattr(request, '_user_relations', None)
+    if relations is None:
+        relations = request._user_relations = fetch_relations(
+            request.user.id
+        )
+    return relations
+
+
+def relations_changed(user_id):
+    transaction.on_commit(
+        lambda: bump_version(relations_version(user_id))
+    )
+
+
+def insert_sql(model, instances, connection):
+    """INSERT ... ON CONFLICT DO NOTHING для instances: пары (sql, params)."""
+    fields = [
+        field for field in model._meta.concrete_fields
+        if not field.primary_key
+    ]
+    query = InsertQuery(model, ignore_conflicts=True)
+    query.insert_values(fields, instances)
+    return query.get_compiler(connection=connection).as_sql()
+
+
+def insert_relation(model, **values):
+    """Добавляет связь одним INSERT ... ON CONFLICT DO NOTHING.
+
+    Возвращает True, если строка вставлена. Повтор, в том числе
+    одновременный (двойной клик), упирается в уникальное ограничение
+    и просто ничего не вставляет, без IntegrityError.
+    """
+    connection = connections[router.db_for_write(model)]
+    inserted = 0
+    with connection.cursor() as cursor:
+        for sql, params in insert_sql(model, [model(**values)], connection):
+            cursor.execute(sql, params)
+            inserted += cursor.rowcount
+    return inserted > 0
+
+
+def insert_relations(model, user_id, field, ids):
+    """Связи пользователя с объектами ids, вставленные этим вызовом.
+
+    На PostgreSQL - один INSERT ... ON CONFLICT DO NOTHING RETURNING:
+    строки, которые успел вставить одновременный запрос, в ответ
+    не попадают. На остальных базах связи вставляются по одной.
+    """
+    attname = model._meta.get_field(field).attname
+    connection = connections[router.db_for_write(model)]
+    if connection.vendor != 'postgresql':
+        return [
+            pk for pk in ids
+            if insert_relation(model, user_id=user_id, **{attname: pk})
+        ]
+    instances = [model(user_id=user_id, **{attname: pk}) for pk in ids]
+    returning = f' RETURNING {connection.ops.quote_name(attname)}'
+    inserted = []
+    with connection.cursor() as cursor:
+        for sql, params in insert_sql(model, instances, connection):
+            cursor.execute(sql + returning, params)
+            inserted += [pk for pk, in cursor.fetchall()]
+    return inserted
+
+
+def delete_relations(model, user_id, field, ids):
+    """Удаляет связи пользователя с объектами ids; возвращает id тех,
+    что удалил этот вызов.
+
+    Строки сначала блокируются SELECT ... FOR UPDATE: одновременный
+    запрос ждёт фиксации и уже не видит удалённых строк, так что каждую
+    связь засчитывает ровно один из них. Вызывается в транзакции.
+    """
+    attname = model._meta.get_field(field).attname
+    rows = dict(model.objects.select_for_update().filter(
+        user_id=user_id, **{f'{attname}__in': ids}
+    ).values_list('pk', attname))
+    if rows:
+        model.objects.filter(pk__in=rows).delete()
+    return list(rows.values())
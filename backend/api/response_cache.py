@@ -0,0 +1,163 @@
+import hashlib
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import (
+    http_date,
+    parse_etags,
+    parse_http_date_safe,
+    quote_etag,
+)
+from rest_framework.renderers import JSONRenderer
+
+from .cache import (
+    bump_version,
+    get_shared_cache,
+    get_versions,
+    version_timestamp,
+)
+from .catalog import ingredient_catalog, tag_catalog
+from .db_router import read_from_primary
+
+FEED = 'recipes:feed'
+CATALOG_VERSIONS = (tag_catalog.name, ingredient_catalog.name)
+
+
+def recipe_version(pk):
+    return f'recipes:{pk}'
+
+
+def profile_version(user_id):
+    return f'users:{user_id}:profile'
+
+
+def invalidate_recipe(pk):
+    bump_version(recipe_version(pk))
+    bump_version(FEED)
+
+
+def invalidate_profile(user_id):
+    bump_version(profile_version(user_id))
+    bump_version(FEED)
+
+
+class AnonymousResponseCacheMixin:
+    """Кеш готовых JSON-ответов list и retrieve для анонимных запросов.
+
+    Запись хранит версии данных, от которых зависит ответ, и считается
+    устаревшей, как только любая из них сменилась. ETag и Last-Modified
+    позволяют клиентам получать 304 без передачи тела.
+
+    Кеш работает только с общим кешем (API_CACHE_ALIAS): версии
+    в памяти процесса не видны другим воркерам, и они отдавали бы
+    устаревшие ответы.
+    """
+
+    cached_list_params = (
+        'tags', 'author', 'page', 'limit', 'cursor', 'search'
+    )
+
+    def is_cacheable(self, request):
+        return (
+            get_shared_cache() is not None
+            and request.user.is_anonymous
+            and request.accepted_renderer.format == 'json'
+            and set(request.query_params) <= set(self.cached_list_params)
+        )
+
+    def get_cache_key(self, request):
+        params = sorted(
+            (name, sorted(set(request.query_params.getlist(name))))
+            for name in self.cached_list_params
+            if name in request.query_params
+        )
+        raw = f'{request.get_host()}{request.path}{params}'
+        return 'response:' + hashlib.md5(raw.encode()).hexdigest()
+
+    def list(self, request, *args, **kwargs):
+        if not self.is_cacheable(request):
+            return super().list(request, *args, **kwargs)
+
+        def build():
+            queryset = self.filter_queryset(self.get_queryset())
+            page = self.paginate_queryset(queryset)
+            serializer = self.get_serializer(page, many=True)
+            data = self.get_paginated_response(serializer.data).data
+            # Версии рецептов страницы: избранное меняет favorites_count
+            # одного рецепта, не трогая ленту целиком.
+            return data, [recipe.pub_date for recipe in page], [
+                recipe_version(recipe.pk) for recipe in page
+            ]
+
+        return self.cached_response(
+            request, (FEED, *CATALOG_VERSIONS), build
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        if not self.is_cacheable(request):
+            return super().retrieve(request, *args, **kwargs)
+
+        def build():
+            instance = self.get_object()
+            data = self.get_serializer(instance).data
+            return data, [instance.pub_date], [
+                profile_version(instance.author_id)
+            ]
+
+        return self.cached_response(
+            request,
+            (recipe_version(self.kwargs[self.lookup_field]),
+             *CATALOG_VERSIONS),
+            build,
+        )
+
+    def cached_response(self, request, dependencies, build):
+        cache = get_shared_cache()
+        key = self.get_cache_key(request)
+        entry = cache.get(key)
+        if entry is not None:
+            current = get_versions(entry['versions'])
+            if current != entry['versions']:
+                entry = None
+        if entry is None:
+            versions = get_versions(dependencies)
+            with read_from_primary():
+                data, pub_dates, extra_dependencies = build()
+            versions.update(get_versions(extra_dependencies))
+            content = JSONRenderer().render(data)
+            last_modified = max([
+                *(int(pub_date.timestamp()) for pub_date in pub_dates),
+                *(version_timestamp(version) for version in versions.values()),
+            ])
+            entry = {
+                'versions': versions,
+                'content': content,
+                'etag': quote_etag(hashlib.md5(
+                    key.encode() + str(sorted(versions.items())).encode()
+                ).hexdigest()),
+                'last_modified': last_modified,
+            }
+            cache.set(key, entry, settings.RECIPE_RESPONSE_CACHE_TIMEOUT)
+
+        if self.is_not_modified(request, entry):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(
+                entry['content'], content_type='application/json'
+            )
+        response['ETag'] = entry['etag']
+        response['Last-Modified'] = http_date(entry['last_modified'])
+        response['Vary'] = 'Accept, Authorization'
+        return response
+
+    def is_not_modified(self, request, entry):
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match:
+            return entry['etag'] in parse_etags(if_none_match)
+        if_modified_since = parse_http_date_safe(
+            request.headers.get('If-Modified-Since', '')
+        )
+        return (
+            if_modified_since is not None
+            and if_modified_since >= entry['last_modified']
+        )
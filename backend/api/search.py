@@ -0,0 +1,81 @@
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, IntegerField, Value, When
+
+from recipes.models import Ingredient
+from .catalog import ingredient_catalog
+from .ingredient_snapshot import get_snapshot
+
+
+class IngredientPrefixIndex:
+    """Отсортированный массив названий ингредиентов в памяти процесса.
+
+    Совпадения по префиксу ищутся бинарным поиском, совпадения
+    по подстроке - линейным проходом, и только если префиксных
+    совпадений не хватило до лимита.
+    """
+
+    def __init__(self, ingredients):
+        self.items = sorted(
+            (ingredient.name.lower(), ingredient.id, ingredient)
+            for ingredient in ingredients
+        )
+        self.keys = [key for key, _, _ in self.items]
+
+    def search(self, query, limit):
+        query = query.lower()
+        found = []
+        position = bisect_left(self.keys, query)
+        while (
+            len(found) < limit
+            and position < len(self.keys)
+            and self.keys[position].startswith(query)
+        ):
+            found.append(self.items[position][2])
+            position += 1
+        if len(found) < limit:
+            for key, _, ingredient in self.items:
+                if query in key and not key.startswith(query):
+                    found.append(ingredient)
+                    if len(found) == limit:
+                        break
+        return found
+
+
+_prefix_index = (None, None)
+
+
+def get_prefix_index():
+    """Индекс перестраивается, когда перезагружается справочник."""
+    global _prefix_index
+    objects = ingredient_catalog.get()['objects']
+    source, index = _prefix_index
+    if source is not objects:
+        index = IngredientPrefixIndex(objects.values())
+        _prefix_index = (objects, index)
+    return index
+
+
+def get_search_backend():
+    backend = getattr(settings, 'INGREDIENT_SEARCH_BACKEND', None)
+    if backend:
+        return backend
+    return 'database' if connection.vendor == 'postgresql' else 'memory'
+
+
+def search_ingredients(query, limit):
+    """Ингредиенты по префиксу, затем по подстроке, не более limit."""
+    if get_search_backend() == 'memory':
+        snapshot = get_snapshot()
+        if snapshot is not None:
+            return snapshot.search(query, limit)
+        return get_prefix_index().search(query, limit)
+    return Ingredient.objects.filter(name__icontains=query).annotate(
+        is_substring=Case(
+            When(name__istartswith=query, then=Value(0)),
+            default=Value(1),
+            output_field=IntegerField(),
+        )
+    ).order_by('is_substring', 'name')[:limit]
@@ -1,19 +1,20 @@
-import base64
 from rest_framework import serializers, exceptions
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.shortcuts import get_object_or_404
+from django.db import transaction
 from djoser.serializers import UserSerializer
 from django.core.validators import MinValueValidator
-from django.core.files.base import ContentFile
 
+from .catalog import ingredient_catalog, missing_ids, tag_catalog
+from .images import decode_base64_image, enqueue_variants, variant_urls
+from .ingredient_snapshot import get_snapshot, lookup_ingredient
+from .relations import get_user_relations
 from .validator import username_validator
 from recipes.models import (
     Tag,
     Ingredient,
     Recipe,
     RecipeIngredients,
-    Favorite,
-    ShoppingCart,
 )
 from users.models import Follow
 
@@ -26,45 +27,91 @@ class Base64ImageField(serializers.ImageField):
     def to_internal_value(self, data):
 
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='image.' + ext)
+            data = decode_base64_image(data)
         return super().to_internal_value(data)
 
 
+class ImageVariantsField(serializers.ReadOnlyField):
+    """Ссылки на уменьшенные копии изображения, когда они готовы."""
+
+    def to_representation(self, value):
+        return variant_urls(value, self.context.get('request'))
+
+
+class CatalogPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """Объект по id из кешированного справочника, без запроса к базе."""
+
+    def __init__(self, catalog=None, **kwargs):
+        self.catalog = catalog
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        instance = self.catalog.get_object(pk)
+        if instance is None:
+            self.fail('does_not_exist', pk_value=data)
+        return instance
+
+
 class UserSerializer(UserSerializer):
 
     username = serializers.CharField(
         validators=(username_validator,)
     )
     is_subscribed = serializers.SerializerMethodField()
+    avatar_variants = ImageVariantsField()
 
     def get_is_subscribed(self, obj):
 
-        user = self.context.get('request').user
-        if user.is_anonymous:
-            return False
-        return Follow.objects.filter(user=user, author=obj.id).exists()
+        relations = get_user_relations(self.context.get('request'))
+        return relations is not None and relations.contains(
+            'following', obj.id
+        )
 
     class Meta:
         model = User
         fields = ['first_name', 'last_name', 'id', 'is_subscribed',
-                  'username', 'email', 'avatar']
+                  'username', 'email', 'avatar', 'avatar_variants']
+
+
+class ProfileSerializer(UserSerializer):
+    """Профиль пользователя со счётчиками рецептов и подписок."""
+
+    class Meta(UserSerializer.Meta):
+        fields = UserSerializer.Meta.fields + [
+            'recipes_count', 'followers_count', 'following_count'
+        ]
+        read_only_fields = (
+            'recipes_count', 'followers_count', 'following_count'
+        )
 
 
 class AvatarSerializer(serializers.ModelSerializer):
 
     avatar = Base64ImageField(required=False, allow_null=True)
 
+    def update(self, instance, validated_data):
+        instance.avatar_variants = {}
+        instance = super().update(instance, validated_data)
+        transaction.on_commit(lambda: enqueue_variants(instance, 'avatar'))
+        return instance
+
     class Meta:
         model = User
         fields = ['avatar']
 
 
 class ShortRecipeSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
 
 
 class SubscriptionSerializer(UserSerializer):
@@ -76,7 +123,7 @@ class SubscriptionSerializer(UserSerializer):
     first_name = serializers.ReadOnlyField(source='author.first_name')
     last_name = serializers.ReadOnlyField(source='author.last_name')
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.ReadOnlyField(source='author.recipes.count')
+    recipes_count = serializers.ReadOnlyField(source='author.recipes_count')
     is_subscribed = serializers.SerializerMethodField()
     avatar = Base64ImageField(
         required=False, allow_null=True, source='author.avatar'
@@ -96,20 +143,22 @@ class SubscriptionSerializer(UserSerializer):
             'avatar',
         )
 
+    def get_is_subscribed(self, obj):
+        """Сериализуется сама подписка, поэтому она всегда существует."""
+        return True
+
     def get_recipes(self, obj):
         """Получение списка рецептов автора."""
 
-        request = self.context.get('request')
-        recipes = obj.author.recipes.all()
-        recipes_limit = request.query_params.get('recipes_limit')
-        if recipes_limit:
-            recipes = recipes[:int(recipes_limit)]
+        recipes = getattr(obj.author, 'latest_recipes', None)
+        if recipes is None:
+            request = self.context.get('request')
+            recipes = obj.author.recipes.all()
+            recipes_limit = request.query_params.get('recipes_limit')
+            if recipes_limit:
+                recipes = recipes[:int(recipes_limit)]
         return ShortRecipeSerializer(recipes, many=True).data
 
-    def get_recipes_count(self, obj):
-        """Количество рецептов автора."""
-        return Recipe.objects.filter(author=obj.id).count()
-
 
 class TagSerializer(serializers.ModelSerializer):
     class Meta:
@@ -123,12 +172,26 @@ class IngredientSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class SnapshotIngredientField(serializers.ReadOnlyField):
+    """Поле ингредиента строки рецепта из снимка справочника; если
+    снимка нет или ингредиента в нём ещё нет - из загруженного объекта.
+    """
+
+    def __init__(self, attribute, **kwargs):
+        self.attribute = attribute
+        super().__init__(source='*', **kwargs)
+
+    def to_representation(self, value):
+        entry = lookup_ingredient(value.ingredient_id)
+        if entry is None:
+            entry = value.ingredient
+        return getattr(entry, self.attribute)
+
+
 class RecipeIngredientsSerializer(serializers.ModelSerializer):
-    id = serializers.ReadOnlyField(source='ingredient.id')
-    name = serializers.ReadOnlyField(source='ingredient.name')
-    measurement_unit = serializers.ReadOnlyField(
-        source='ingredient.measurement_unit'
-    )
+    id = serializers.ReadOnlyField(source='ingredient_id')
+    name = SnapshotIngredientField('name')
+    measurement_unit = SnapshotIngredientField('measurement_unit')
 
     class Meta:
         model = RecipeIngredients
@@ -136,7 +199,9 @@ class RecipeIngredientsSerializer(serializers.ModelSerializer):
 
 
 class CreateUpdateRecipeIngredientsSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    id = CatalogPrimaryKeyRelatedField(
+        catalog=ingredient_catalog, queryset=Ingredient.objects.all()
+    )
     amount = serializers.IntegerField(
         validators=(
             MinValueValidator(
@@ -154,6 +219,7 @@ class RecipeSerializer(serializers.ModelSerializer):
     author = UserSerializer(read_only=True)
     tags = TagSerializer(many=True)
     image = Base64ImageField()
+    image_variants = ImageVariantsField()
     ingredients = RecipeIngredientsSerializer(
         source='recipe_ingredients', many=True
     )
@@ -162,35 +228,32 @@ class RecipeSerializer(serializers.ModelSerializer):
 
     def get_is_favorited(self, obj):
 
-        request = self.context.get('request')
-        if request.user.is_anonymous:
-            return False
-        return Favorite.objects.filter(
-            user=request.user, recipe=obj
-        ).exists()
+        relations = get_user_relations(self.context.get('request'))
+        return relations is not None and relations.contains(
+            'favorites', obj.id
+        )
 
     def get_is_in_shopping_cart(self, obj):
 
-        request = self.context.get('request')
-        if request.user.is_anonymous:
-            return False
-        return ShoppingCart.objects.filter(
-            user=request.user, recipe=obj
-        ).exists()
+        relations = get_user_relations(self.context.get('request'))
+        return relations is not None and relations.contains(
+            'shopping_cart', obj.id
+        )
 
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients',
                   'is_favorited', 'is_in_shopping_cart', 'name',
-                  'image', 'text', 'cooking_time'
+                  'image', 'image_variants', 'text', 'cooking_time',
+                  'favorites_count'
                   )
 
 
 class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
     image = Base64ImageField()
     author = UserSerializer(read_only=True)
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(), many=True
+    tags = CatalogPrimaryKeyRelatedField(
+        catalog=tag_catalog, queryset=Tag.objects.all(), many=True
     )
     ingredients = CreateUpdateRecipeIngredientsSerializer(many=True)
     cooking_time = serializers.IntegerField(
@@ -234,22 +297,78 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
 
         return value
 
+    def validate(self, data):
+        """Теги и ингредиенты из справочника в памяти перепроверяются
+        по базе, иначе вставка рецепта с только что удалённым тегом или
+        ингредиентом упала бы с IntegrityError.
+        """
+        missing = missing_ids({
+            Tag: [tag.id for tag in data.get('tags', ())],
+            Ingredient: [
+                item['id'].id for item in data.get('ingredients', ())
+            ],
+        })
+        errors = {}
+        if missing[Tag]:
+            errors['tags'] = [
+                f'Тег {pk} не существует.' for pk in sorted(missing[Tag])
+            ]
+        if missing[Ingredient]:
+            errors['ingredients'] = [
+                f'Ингредиент {pk} не существует.'
+                for pk in sorted(missing[Ingredient])
+            ]
+        if errors:
+            raise exceptions.ValidationError(errors)
+        return data
+
     def create_tags(self, data, tags):
         return data.tags.set(tags)
 
     def create_ingredients(self, data, ingredients):
-        for ingredient in ingredients:
-            amount = ingredient.get('amount')
-            ingredient = get_object_or_404(
-                Ingredient, pk=ingredient.get('id').id
-            )
-
-            RecipeIngredients.objects.update_or_create(
+        RecipeIngredients.objects.bulk_create(
+            RecipeIngredients(
                 recipe=data,
-                ingredient=ingredient,
-                defaults={'amount': amount},
+                ingredient=ingredient.get('id'),
+                amount=ingredient.get('amount'),
             )
+            for ingredient in ingredients
+        )
 
+    def update_ingredients(self, data, ingredients):
+        """Удаляет, изменяет и добавляет только отличающиеся строки.
+
+        Возвращает True, если изменился набор ингредиентов.
+        """
+        amounts = {
+            ingredient.get('id').id: ingredient.get('amount')
+            for ingredient in ingredients
+        }
+        current = {
+            row.ingredient_id: row
+            for row in RecipeIngredients.objects.filter(recipe=data)
+        }
+        removed = current.keys() - amounts.keys()
+        if removed:
+            RecipeIngredients.objects.filter(
+                recipe=data, ingredient_id__in=removed
+            ).delete()
+        changed = []
+        for ingredient_id, row in current.items():
+            amount = amounts.get(ingredient_id)
+            if amount is not None and row.amount != amount:
+                row.amount = amount
+                changed.append(row)
+        if changed:
+            RecipeIngredients.objects.bulk_update(changed, ('amount',))
+        added = [
+            ingredient for ingredient in ingredients
+            if ingredient.get('id').id not in current
+        ]
+        self.create_ingredients(data=data, ingredients=added)
+        return bool(removed or added)
+
+    @transaction.atomic
     def create(self, validated_data):
         author = self.context.get('request').user
         tags = validated_data.pop('tags')
@@ -258,9 +377,13 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
         recipe = Recipe.objects.create(author=author, **validated_data)
         self.create_tags(data=recipe, tags=tags)
         self.create_ingredients(data=recipe, ingredients=ingredients)
+        Recipe.objects.filter(pk=recipe.pk).update_search_vector()
+        Recipe.objects.filter(pk=recipe.pk).update_ingredient_ids()
+        transaction.on_commit(lambda: enqueue_variants(recipe, 'image'))
 
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         tags = validated_data.pop('tags', None)
         if not tags:
@@ -274,14 +397,25 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
             raise exceptions.ValidationError(
                 'Добавьте хотя бы один ингредиент!'
             )
-        instance.ingredients.clear()
-        self.create_ingredients(data=instance, ingredients=ingredients)
+        if self.update_ingredients(data=instance, ingredients=ingredients):
+            Recipe.objects.filter(pk=instance.pk).update_ingredient_ids()
 
-        return super().update(instance, validated_data)
+        if 'image' in validated_data:
+            instance.image_variants = {}
+            transaction.on_commit(
+                lambda: enqueue_variants(instance, 'image')
+            )
+        instance = super().update(instance, validated_data)
+        Recipe.objects.filter(pk=instance.pk).update_search_vector()
+        return instance
 
     def to_representation(self, instance):
+        request = self.context.get('request')
+        instance = Recipe.objects.with_related(
+            ingredients=get_snapshot() is None
+        ).get(pk=instance.pk)
         serializer = RecipeSerializer(
-            instance, context={'request': self.context.get('request')}
+            instance, context={'request': request}
         )
 
         return serializer.data
@@ -289,3 +423,16 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Recipe
         exclude = ('pub_date',)
+
+
+class BulkIdsSerializer(serializers.Serializer):
+    """Список id для массового добавления и удаления связей."""
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BULK_RELATIONS_LIMIT,
+        error_messages={
+            'max_length': 'Не больше {max_length} id за один запрос.',
+        },
+    )
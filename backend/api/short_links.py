@@ -0,0 +1,74 @@
+from array import array
+from bisect import bisect_left
+
+import short_url
+from django.conf import settings
+from django.http import (
+    Http404,
+    HttpResponsePermanentRedirect,
+    HttpResponseRedirect,
+)
+from django.utils.cache import patch_cache_control
+
+from recipes.models import Recipe
+from .cache import VersionedValue
+
+
+def load_recipe_ids():
+    return array('q', Recipe.objects.order_by('pk').values_list(
+        'pk', flat=True
+    ).iterator())
+
+
+recipe_ids = VersionedValue('recipes:ids', load_recipe_ids)
+
+
+def contains(ids, pk):
+    position = bisect_left(ids, pk)
+    return position < len(ids) and ids[position] == pk
+
+
+def recipe_exists(pk):
+    """Проверка по отсортированному массиву id в памяти.
+
+    Массив может отставать от базы в других процессах, поэтому
+    отсутствующий в нём id перепроверяется запросом.
+    """
+    if contains(recipe_ids.get(), pk):
+        return True
+    return Recipe.objects.filter(pk=pk).exists()
+
+
+def encode(pk):
+    return short_url.encode_url(pk)
+
+
+def decode(code):
+    try:
+        return short_url.decode_url(code)
+    except ValueError:
+        return None
+
+
+def short_link_redirect(request, code):
+    """Переход по короткой ссылке /s/<code>: обычное представление Django
+    без аутентификации и согласования формата DRF.
+    """
+    pk = decode(code)
+    if pk is None or not recipe_exists(pk):
+        raise Http404
+    return recipe_redirect(request, pk)
+
+
+def recipe_redirect(request, pk):
+    redirect_class = (
+        HttpResponsePermanentRedirect
+        if settings.SHORT_LINK_PERMANENT_REDIRECT
+        else HttpResponseRedirect
+    )
+    response = redirect_class(request.build_absolute_uri(f'/recipes/{pk}/'))
+    if settings.SHORT_LINK_CACHE_MAX_AGE:
+        patch_cache_control(
+            response, public=True, max_age=settings.SHORT_LINK_CACHE_MAX_AGE
+        )
+    return response
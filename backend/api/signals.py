@@ -0,0 +1,113 @@
+from django.contrib.auth import get_user_model
+from django.core.signals import request_started
+from django.db import transaction
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+)
+
+from recipes.models import Favorite, Ingredient, Recipe, RecipeIngredients
+from users.models import Follow
+from .cache import mark_request_started
+from .catalog import CATALOGS
+from .counters import recount_later
+from .short_links import recipe_ids
+from .response_cache import invalidate_profile, invalidate_recipe
+
+User = get_user_model()
+
+
+def catalog_changed(sender, **kwargs):
+    transaction.on_commit(CATALOGS[sender].invalidate)
+
+
+for model in CATALOGS:
+    post_save.connect(catalog_changed, sender=model)
+    post_delete.connect(catalog_changed, sender=model)
+request_started.connect(mark_request_started)
+
+
+def recipe_changed(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: invalidate_recipe(pk))
+
+
+def recipe_ingredients_changed(sender, instance, **kwargs):
+    recipe_id = instance.recipe_id
+    transaction.on_commit(lambda: invalidate_recipe(recipe_id))
+
+
+def recipe_created(sender, instance, created, **kwargs):
+    if created:
+        recount_later(User, (instance.author_id,))
+        transaction.on_commit(recipe_ids.invalidate)
+
+
+def recipe_deleted(sender, instance, **kwargs):
+    recount_later(User, (instance.author_id,))
+    transaction.on_commit(recipe_ids.invalidate)
+
+
+def follow_created(sender, instance, created, **kwargs):
+    # API добавляет подписки и избранное INSERT без сигналов и меняет
+    # счётчики сам; сюда попадают записи через ORM.
+    if created:
+        recount_later(User, (instance.user_id, instance.author_id))
+
+
+def favorite_created(sender, instance, created, **kwargs):
+    if created:
+        recount_later(Recipe, (instance.recipe_id,))
+
+
+def user_deleted(sender, instance, **kwargs):
+    """Подписки и избранное пользователя удаляются каскадом: счётчики
+    его авторов, подписчиков и рецептов пересчитываются.
+    """
+    follows = Follow.objects.filter(user=instance).values_list(
+        'author_id', flat=True
+    ).union(
+        Follow.objects.filter(author=instance).values_list(
+            'user_id', flat=True
+        )
+    )
+    recount_later(User, follows)
+    recount_later(Recipe, Favorite.objects.filter(
+        user=instance
+    ).values_list('recipe_id', flat=True))
+
+
+def recipe_tags_changed(sender, instance, action, **kwargs):
+    if action.startswith('post_') and isinstance(instance, Recipe):
+        recipe_changed(sender, instance)
+
+
+def ingredient_renamed(sender, instance, created, update_fields=None,
+                       **kwargs):
+    if created or (update_fields is not None and 'name' not in update_fields):
+        return
+    Recipe.objects.filter(
+        recipe_ingredients__ingredient=instance
+    ).update_search_vector()
+
+
+def profile_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    user_id = instance.pk
+    transaction.on_commit(lambda: invalidate_profile(user_id))
+
+
+for signal in (post_save, post_delete):
+    signal.connect(recipe_changed, sender=Recipe)
+    signal.connect(recipe_ingredients_changed, sender=RecipeIngredients)
+    signal.connect(profile_changed, sender=User)
+post_save.connect(ingredient_renamed, sender=Ingredient)
+post_save.connect(recipe_created, sender=Recipe)
+post_delete.connect(recipe_deleted, sender=Recipe)
+pre_delete.connect(user_deleted, sender=User)
+post_save.connect(follow_created, sender=Follow)
+post_save.connect(favorite_created, sender=Favorite)
+m2m_changed.connect(recipe_tags_changed, sender=Recipe.tags.through)
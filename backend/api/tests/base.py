@@ -0,0 +1,100 @@
+from itertools import count
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, Recipe, RecipeIngredients, Tag
+from ..cache import _local_versions
+
+User = get_user_model()
+
+author_numbers = count()
+
+
+def reset_caches():
+    """Версии кешей сбрасываются при фиксации транзакции, а TestCase её
+    не фиксирует: без сброса тесты видели бы данные друг друга.
+    """
+    _local_versions.clear()
+    caches['default'].clear()
+
+
+def create_user(number):
+    return User.objects.create_user(
+        username=f'user{number}',
+        email=f'user{number}@example.com',
+        password='password',
+        first_name='Имя',
+        last_name='Фамилия',
+    )
+
+
+def create_recipes(total, tags, ingredients):
+    """Рецепты разных авторов, каждый с тегами и ингредиентами."""
+    recipes = []
+    for _ in range(total):
+        number = next(author_numbers)
+        recipe = Recipe.objects.create(
+            author=create_user(f'author{number}'),
+            name=f'Рецепт {number}',
+            image='recipes/images/recipe.png',
+            text='Описание',
+            cooking_time=10,
+        )
+        recipe.tags.set(tags)
+        RecipeIngredients.objects.bulk_create(
+            RecipeIngredients(recipe=recipe, ingredient=ingredient, amount=5)
+            for ingredient in ingredients
+        )
+        recipes.append(recipe)
+    return recipes
+
+
+class APITestCase(TestCase):
+    """Пользователь с настоящим токеном: запрос токена входит в число
+    SQL-запросов, как в рабочем окружении.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('reader')
+        cls.token = Token.objects.create(user=cls.user)
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {number}', slug=f'tag{number}')
+            for number in range(2)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(3)
+        ]
+
+    def setUp(self):
+        reset_caches()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def count_queries(self, url):
+        """Число SQL-запросов повторного GET: первый прогревает кеши
+        справочников в памяти процесса.
+        """
+        self.get(url)
+        with CaptureQueriesContext(connection) as context:
+            self.get(url)
+        return len(context)
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response
+
+    def assertSameQueries(self, queries, url):
+        self.get(url)
+        with self.assertNumQueries(queries):
+            self.get(url)
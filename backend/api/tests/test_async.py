@@ -0,0 +1,56 @@
+from asgiref.sync import async_to_sync
+from django.test import TransactionTestCase
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Ingredient, ShoppingCart, Tag
+from backend.asgi import application
+from .base import create_recipes, create_user
+
+
+class ASGIShoppingCartDownloadTest(TransactionTestCase):
+    """Под ASGI тело потокового ответа отдаётся из цикла событий."""
+
+    def test_download_through_asgi_application(self):
+        user = create_user('buyer')
+        token = Token.objects.create(user=user)
+        ingredient = Ingredient.objects.create(
+            name='Мука', measurement_unit='г'
+        )
+        tag = Tag.objects.create(name='Завтрак', slug='breakfast')
+        recipe, = create_recipes(1, [tag], [ingredient])
+        ShoppingCart.objects.create(user=user, recipe=recipe)
+        messages = async_to_sync(self.call_asgi)(
+            '/api/recipes/download_shopping_cart/', token.key
+        )
+        self.assertEqual(messages[0]['status'], 200)
+        body = b''.join(message.get('body', b'') for message in messages[1:])
+        self.assertEqual(
+            body.decode(), 'Список покупок:\nМука: 5, г\n'
+        )
+
+    async def call_asgi(self, path, token):
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        await application({
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': path,
+            'root_path': '',
+            'query_string': b'',
+            'headers': [
+                (b'host', b'localhost'),
+                (b'authorization', f'Token {token}'.encode()),
+            ],
+            'client': ('127.0.0.1', 50000),
+            'server': ('localhost', 80),
+        }, receive, send)
+        return messages
@@ -0,0 +1,92 @@
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import override_settings
+
+from recipes.models import Ingredient, Recipe, Tag
+from ..ingredient_snapshot import get_snapshot, snapshot_file
+from ..management.commands.benchmark_api import PIXEL
+from .base import APITestCase
+
+
+@override_settings(MEDIA_ROOT=tempfile.gettempdir())
+class StaleCatalogTest(APITestCase):
+    """Справочник в памяти воркера может отставать от базы."""
+
+    def recipe_payload(self, ingredient):
+        return {
+            'name': 'Рецепт',
+            'text': 'Описание',
+            'cooking_time': 5,
+            'image': f'data:image/png;base64,{PIXEL}',
+            'tags': [self.tags[0].id],
+            'ingredients': [{'id': ingredient.id, 'amount': 1}],
+        }
+
+    def test_deleted_ingredient_is_rejected_with_400(self):
+        ingredient = Ingredient.objects.create(
+            name='Удаляемый', measurement_unit='г'
+        )
+        self.get('/api/ingredients/')
+        # Сигнал об удалении срабатывает при фиксации транзакции, которой
+        # в TestCase нет: справочник остаётся устаревшим, как в другом
+        # воркере.
+        Ingredient.objects.filter(pk=ingredient.pk).delete()
+        response = self.client.post(
+            '/api/recipes/', self.recipe_payload(ingredient), format='json'
+        )
+        self.assertEqual(response.status_code, 400, response.content)
+        self.assertIn('ingredients', response.data)
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_new_tag_is_listed_without_shared_cache(self):
+        """Без общего кеша справочник загружается заново в каждом запросе."""
+        self.get('/api/tags/')
+        # Как и удаление выше, смена версии при фиксации не срабатывает.
+        tag = Tag.objects.create(name='Новый', slug='new')
+        ids = [row['id'] for row in self.get('/api/tags/').json()]
+        self.assertIn(tag.id, ids)
+
+
+class IngredientSnapshotTest(APITestCase):
+    """Изменение ингредиента не пересобирает снимок в запросе."""
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(INGREDIENT_SNAPSHOT_PATH=os.path.join(
+            directory.name, 'ingredients.snapshot'
+        ))
+        settings.enable()
+        self.addCleanup(settings.disable)
+        snapshot_file.expire()
+        self.addCleanup(snapshot_file.expire)
+
+    def test_changed_ingredient_marks_snapshot_stale(self):
+        ingredient = self.ingredients[0]
+        call_command('build_ingredient_snapshot', stdout=StringIO())
+        self.assertEqual(
+            get_snapshot().get(ingredient.id).name, ingredient.name
+        )
+
+        ingredient.name = 'Переименованный'
+        with mock.patch(
+            'api.ingredient_snapshot.write_snapshot'
+        ) as write_snapshot:
+            with self.captureOnCommitCallbacks(execute=True):
+                ingredient.save()
+        write_snapshot.assert_not_called()
+        self.assertIsNone(get_snapshot())
+        response = self.get(f'/api/ingredients/{ingredient.id}/')
+        self.assertEqual(response.json()['name'], 'Переименованный')
+
+        call_command(
+            'build_ingredient_snapshot', if_stale=True, stdout=StringIO()
+        )
+        self.assertEqual(
+            get_snapshot().get(ingredient.id).name, 'Переименованный'
+        )
@@ -0,0 +1,42 @@
+from django.test import TransactionTestCase
+
+from recipes.models import Favorite, Ingredient, Recipe, Tag
+from users.models import Follow
+from .base import User, create_recipes, create_user
+
+
+class CountersOutsideAPITest(TransactionTestCase):
+    """Счётчики сходятся со связями после записи через ORM, удаления
+    через QuerySet и каскадного удаления пользователя.
+    """
+
+    def test_counters_follow_orm_writes_and_cascades(self):
+        tag = Tag.objects.create(name='Суп', slug='soup')
+        ingredient = Ingredient.objects.create(
+            name='Вода', measurement_unit='мл'
+        )
+        recipe, other = create_recipes(2, [tag], [ingredient])
+        author = recipe.author
+        follower = create_user('follower')
+        Follow.objects.create(user=follower, author=author)
+        Favorite.objects.create(user=follower, recipe=recipe)
+        self.assertCounters(author, recipes_count=1, followers_count=1)
+        self.assertCounters(follower, following_count=1)
+        self.assertEqual(
+            Recipe.objects.get(pk=recipe.pk).favorites_count, 1
+        )
+
+        User.objects.filter(pk=follower.pk).delete()
+        self.assertCounters(author, recipes_count=1, followers_count=0)
+        self.assertEqual(
+            Recipe.objects.get(pk=recipe.pk).favorites_count, 0
+        )
+
+        Recipe.objects.filter(pk=recipe.pk).delete()
+        self.assertCounters(author, recipes_count=0)
+
+    def assertCounters(self, user, **expected):
+        user = User.objects.get(pk=user.pk)
+        self.assertEqual(
+            {field: getattr(user, field) for field in expected}, expected
+        )
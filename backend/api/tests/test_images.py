@@ -0,0 +1,21 @@
+import base64
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from ..images import decode_base64_image
+from ..management.commands.benchmark_api import PIXEL
+
+
+class DecodeBase64ImageTest(SimpleTestCase):
+    """Порции base64 с переводами строк выравниваются по 4 символа."""
+
+    def test_line_wrapped_base64_is_decoded(self):
+        raw = base64.b64decode(PIXEL)
+        wrapped = '\r\n'.join(
+            PIXEL[start:start + 7] for start in range(0, len(PIXEL), 7)
+        )
+        with mock.patch('api.images.DECODE_CHUNK_SIZE', 8):
+            upload = decode_base64_image(f'data:image/png;base64,{wrapped}')
+        with upload:
+            self.assertEqual(upload.read(), raw)
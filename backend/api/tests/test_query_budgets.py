@@ -0,0 +1,78 @@
+import logging
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.test import TransactionTestCase, override_settings
+
+from recipes.models import Favorite, ShoppingCart
+from users.models import Follow
+from .base import APITestCase, create_recipes, reset_caches
+
+
+class QueryBudgetTest(TransactionTestCase):
+    """Бюджеты запросов benchmark_api для всех маршрутов на небольшом
+    синтетическом наборе. TransactionTestCase: кеши сбрасываются при
+    фиксации транзакций, как в рабочем окружении.
+    """
+
+    def setUp(self):
+        reset_caches()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = override_settings(
+            MEDIA_ROOT=media.name,
+            IMAGE_QUEUE_DIR=os.path.join(media.name, 'queue'),
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_routes_within_query_budgets(self):
+        call_command(
+            'seed_benchmark_data',
+            users=30, recipes=60, ingredients=30,
+            favorites=200, carts=60, follows=60,
+            stdout=StringIO(),
+        )
+        try:
+            call_command('benchmark_api', repeat=2, stdout=StringIO())
+        except CommandError as error:
+            self.fail(str(error))
+
+
+class RequestQueryBudgetTest(APITestCase):
+    """Запросы с настоящим токеном укладываются в REQUEST_QUERY_BUDGETS."""
+
+    def test_token_requests_are_within_budgets(self):
+        recipes = create_recipes(3, self.tags, self.ingredients)
+        for recipe in recipes:
+            Favorite.objects.create(user=self.user, recipe=recipe)
+            ShoppingCart.objects.create(user=self.user, recipe=recipe)
+        Follow.objects.create(user=self.user, author=recipes[0].author)
+        urls = (
+            '/api/recipes/?limit=6',
+            f'/api/recipes/{recipes[0].id}/',
+            '/api/recipes/download_shopping_cart/',
+            '/api/users/subscriptions/?recipes_limit=3',
+        )
+        for url in urls:
+            self.request(url)
+        with self.assertLogs('api.instrumentation', 'DEBUG') as logs:
+            for url in urls:
+                self.request(url)
+        warnings = [
+            record.getMessage() for record in logs.records
+            if record.levelno > logging.INFO
+        ]
+        self.assertEqual(warnings, [])
+        self.assertEqual(len(logs.records), len(urls))
+
+    def request(self, url):
+        """GET с чтением потокового ответа: запись в журнал и часть
+        запросов приходятся на передачу тела.
+        """
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        if response.streaming:
+            b''.join(response.streaming_content)
@@ -0,0 +1,117 @@
+from django.test import override_settings
+from rest_framework.test import APIClient
+
+from recipes.models import Recipe, RecipeIngredients
+from .base import APITestCase, create_recipes, reset_caches
+
+
+class RecipeListQueriesTest(APITestCase):
+    """Число запросов страницы ленты не зависит от числа рецептов на ней."""
+
+    def test_list_queries_do_not_grow_with_page_size(self):
+        create_recipes(6, self.tags, self.ingredients)
+        queries = self.count_queries('/api/recipes/?limit=1')
+        self.assertSameQueries(queries, '/api/recipes/?limit=6')
+
+    def test_detail_queries_do_not_grow_with_ingredients(self):
+        recipe, = create_recipes(1, self.tags[:1], self.ingredients[:1])
+        queries = self.count_queries(f'/api/recipes/{recipe.id}/')
+        recipe.tags.set(self.tags)
+        RecipeIngredients.objects.bulk_create(
+            RecipeIngredients(recipe=recipe, ingredient=ingredient, amount=1)
+            for ingredient in self.ingredients[1:]
+        )
+        reset_caches()
+        self.assertSameQueries(queries, f'/api/recipes/{recipe.id}/')
+
+
+@override_settings(API_CACHE_ALIAS='default')
+class AnonymousFeedCacheTest(APITestCase):
+    """Кешированная лента для анонимов не отстаёт от счётчика избранного."""
+
+    def test_favorite_refreshes_cached_feed_count(self):
+        recipe, = create_recipes(1, self.tags, self.ingredients)
+        anonymous = APIClient()
+        response = anonymous.get('/api/recipes/')
+        self.assertEqual(response.json()['results'][0]['favorites_count'], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/recipes/{recipe.id}/favorite/')
+        self.assertEqual(response.status_code, 201, response.content)
+        response = anonymous.get('/api/recipes/')
+        self.assertEqual(response.json()['results'][0]['favorites_count'], 1)
+
+    @override_settings(API_CACHE_ALIAS=None)
+    def test_not_cached_without_shared_cache(self):
+        """Версии в памяти процесса не видны другим воркерам: без общего
+        кеша изменение из другого процесса сразу видно в ленте.
+        """
+        recipe, = create_recipes(1, self.tags, self.ingredients)
+        anonymous = APIClient()
+        anonymous.get('/api/recipes/')
+        Recipe.objects.filter(pk=recipe.pk).update(name='Новое название')
+        response = anonymous.get('/api/recipes/')
+        self.assertEqual(
+            response.json()['results'][0]['name'], 'Новое название'
+        )
+
+
+class RecipeCursorPaginationTest(APITestCase):
+    """Курсор ленты по (pub_date, id) при одинаковых датах публикации."""
+
+    def test_pages_neither_skip_nor_repeat_recipes(self):
+        recipes = create_recipes(7, self.tags, self.ingredients)
+        Recipe.objects.update(pub_date=recipes[0].pub_date)
+        expected = sorted((recipe.id for recipe in recipes), reverse=True)
+
+        seen = []
+        url = '/api/recipes/?limit=2&cursor='
+        pages = []
+        while url:
+            data = self.get(url).json()
+            pages.append(url)
+            seen += [recipe['id'] for recipe in data['results']]
+            url = data['next']
+            if len(pages) == 1:
+                # Новый рецепт с той же датой встаёт в начало ленты и не
+                # сдвигает следующие страницы.
+                newer, = create_recipes(1, self.tags, self.ingredients)
+                Recipe.objects.filter(pk=newer.pk).update(
+                    pub_date=recipes[0].pub_date
+                )
+        self.assertEqual(seen, expected)
+
+        data = self.get(pages[2]).json()
+        previous = self.get(data['previous']).json()
+        self.assertEqual(
+            [recipe['id'] for recipe in previous['results']], expected[2:4]
+        )
+
+
+class RecipesByIngredientsTest(APITestCase):
+    """Подбор рецептов по ингредиентам во всех режимах."""
+
+    def test_match_modes(self):
+        first, second, third = self.ingredients
+        full, = create_recipes(1, self.tags, [first, second])
+        partial, = create_recipes(1, self.tags, self.ingredients)
+        create_recipes(1, self.tags, [third])
+        Recipe.objects.update_ingredient_ids()
+        url = (
+            f'/api/recipes/by_ingredients/?ingredients={first.id},{second.id}'
+        )
+        expected = {
+            'all': [(full.id, 0)],
+            'any': [(full.id, 0), (partial.id, 1)],
+            'missing&max_missing=0': [(full.id, 0)],
+            'missing&max_missing=1': [(full.id, 0), (partial.id, 1)],
+        }
+        for mode, recipes in expected.items():
+            with self.subTest(mode=mode):
+                results = self.get(f'{url}&match={mode}').json()['results']
+                self.assertEqual(
+                    [
+                        (recipe['id'], recipe['missing_ingredients'])
+                        for recipe in results
+                    ],
+                    recipes,
+                )
@@ -0,0 +1,131 @@
+import threading
+
+from django.db import connections
+from django.test import TransactionTestCase
+from rest_framework.test import APIClient
+
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from users.models import Follow
+from .base import User, create_recipes, create_user, reset_caches
+
+
+def concurrent_requests(user, method, path, threads, data=None):
+    """Ответы одного и того же запроса, отправленного из threads потоков
+    одновременно, как при двойном клике.
+    """
+    barrier = threading.Barrier(threads)
+    responses = []
+    lock = threading.Lock()
+
+    def worker():
+        client = APIClient()
+        client.force_authenticate(user)
+        try:
+            barrier.wait()
+            response = getattr(client, method)(path, data, format='json')
+        finally:
+            connections.close_all()
+        with lock:
+            responses.append(response)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return responses
+
+
+class BulkRelationsConcurrencyTest(TransactionTestCase):
+    """Одновременные массовые запросы засчитывают каждую связь один раз."""
+
+    threads = 8
+
+    def setUp(self):
+        reset_caches()
+        self.user = create_user('bulk')
+        tag = Tag.objects.create(name='Обед', slug='lunch')
+        ingredient = Ingredient.objects.create(
+            name='Соль', measurement_unit='г'
+        )
+        self.recipes = create_recipes(2, [tag], [ingredient])
+
+    def test_each_relation_is_counted_once(self):
+        ids = [recipe.id for recipe in self.recipes]
+        authors = [recipe.author_id for recipe in self.recipes]
+        cases = (
+            ('/api/recipes/favorite/', ids, Recipe, 'favorites_count'),
+            ('/api/recipes/shopping_cart/', ids, None, None),
+            ('/api/users/subscribe/', authors, User, 'followers_count'),
+        )
+        for path, pks, model, counter in cases:
+            for method, done, total in (
+                ('post', 'added', 1), ('delete', 'removed', 0)
+            ):
+                with self.subTest(path=path, method=method):
+                    responses = concurrent_requests(
+                        self.user, method, path, self.threads, {'ids': pks}
+                    )
+                    self.assertEqual(
+                        [response.status_code for response in responses],
+                        [200] * self.threads,
+                    )
+                    statuses = [
+                        result['status']
+                        for response in responses
+                        for result in response.data['results']
+                    ]
+                    self.assertEqual(statuses.count(done), len(pks))
+                    if model is not None:
+                        self.assertEqual(
+                            list(model.objects.filter(pk__in=pks)
+                                 .values_list(counter, flat=True)),
+                            [total] * len(pks),
+                        )
+
+
+class ToggleConcurrencyTest(TransactionTestCase):
+    """Одновременные повторы добавления в избранное, список покупок
+    и подписки: связь создаёт ровно один запрос, счётчики сходятся.
+    """
+
+    threads = 8
+
+    def setUp(self):
+        reset_caches()
+        self.user = create_user('toggler')
+        tag = Tag.objects.create(name='Ужин', slug='dinner')
+        ingredient = Ingredient.objects.create(
+            name='Перец', measurement_unit='г'
+        )
+        self.recipe, = create_recipes(1, [tag], [ingredient])
+        self.author = self.recipe.author
+
+    def test_concurrent_posts_create_one_relation(self):
+        cases = (
+            (f'/api/recipes/{self.recipe.id}/favorite/', Favorite),
+            (f'/api/recipes/{self.recipe.id}/shopping_cart/', ShoppingCart),
+            (f'/api/users/{self.author.id}/subscribe/', Follow),
+        )
+        for path, model in cases:
+            with self.subTest(path=path):
+                responses = concurrent_requests(
+                    self.user, 'post', path, self.threads
+                )
+                self.assertEqual(
+                    sorted(response.status_code for response in responses),
+                    [201] + [400] * (self.threads - 1),
+                )
+                self.assertEqual(
+                    model.objects.filter(user=self.user).count(), 1
+                )
+        self.recipe.refresh_from_db()
+        self.assertEqual(
+            self.recipe.favorites_count,
+            Favorite.objects.filter(recipe=self.recipe).count(),
+        )
+        self.author.refresh_from_db()
+        self.assertEqual(
+            self.author.followers_count,
+            Follow.objects.filter(author=self.author).count(),
+        )
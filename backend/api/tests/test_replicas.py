@@ -0,0 +1,44 @@
+from django.test import override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import Recipe
+from ..db_router import (
+    ReplicaRouter,
+    pin_cache,
+    primary_pin_key,
+    read_from_replica,
+)
+from .base import APITestCase, create_recipes
+
+
+class ReplicaRoutingTest(APITestCase):
+    """Токен читается из основной базы, пользователь после изменения
+    закрепляется за ней без cookie.
+    """
+
+    def test_token_is_read_from_primary(self):
+        router = ReplicaRouter()
+        with override_settings(DATABASE_REPLICAS=['replica']):
+            with read_from_replica():
+                self.assertEqual(router.db_for_read(Token), 'default')
+                self.assertEqual(router.db_for_read(Recipe), 'replica')
+
+    def test_write_pins_user_without_cookie(self):
+        recipe, = create_recipes(1, self.tags, self.ingredients)
+        # Реплики 'replica' нет среди подключений: чтение с неё упало бы.
+        with override_settings(DATABASE_REPLICAS=['replica']):
+            response = self.client.post(f'/api/recipes/{recipe.id}/favorite/')
+            self.assertEqual(response.status_code, 201, response.content)
+            self.client.cookies.clear()
+            self.get(f'/api/recipes/{recipe.id}/')
+
+    def test_login_pins_user(self):
+        self.user.set_password('password')
+        self.user.save()
+        response = APIClient().post(
+            '/api/auth/token/login/',
+            {'email': self.user.email, 'password': 'password'},
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertTrue(pin_cache().get(primary_pin_key(self.user.pk)))
@@ -0,0 +1,17 @@
+from users.models import Follow
+from .base import APITestCase, create_recipes
+
+
+class SubscriptionsRecipesLimitTest(APITestCase):
+    """recipes_limit в списке подписок."""
+
+    def test_recipes_limit(self):
+        recipe, = create_recipes(1, self.tags, self.ingredients)
+        Follow.objects.create(user=self.user, author=recipe.author)
+        url = '/api/users/subscriptions/?recipes_limit='
+        for value, recipes in (('', 1), ('0', 0), ('1', 1)):
+            with self.subTest(recipes_limit=value):
+                data = self.get(url + value).json()
+                self.assertEqual(len(data['results'][0]['recipes']), recipes)
+        response = self.client.get(url + 'abc')
+        self.assertEqual(response.status_code, 400)
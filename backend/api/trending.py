@@ -0,0 +1,73 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from recipes.models import Favorite, ShoppingCart, TrendingRecipe
+
+EVENTS = (
+    (Favorite, 'favorites'),
+    (ShoppingCart, 'shopping_carts'),
+)
+
+
+def refresh_trending(full=False, batch_size=1000):
+    """Пересчитывает рейтинг рецептов, чей счёт мог измениться.
+
+    Это рецепты, уже попавшие в рейтинг (из окна могли выйти старые
+    добавления или связь могла быть удалена), и рецепты с добавлениями
+    после прошлого пересчёта. При full пересчитывается всё окно.
+    Возвращает число пересчитанных рецептов.
+    """
+    now = timezone.now()
+    since = now - timedelta(days=settings.TRENDING_WINDOW_DAYS)
+    last = None
+    if not full:
+        last = TrendingRecipe.objects.aggregate(
+            last=Max('refreshed_at')
+        )['last']
+    events_since = since if last is None else max(last, since)
+
+    candidates = set(
+        TrendingRecipe.objects.values_list('recipe_id', flat=True)
+    )
+    for model, _ in EVENTS:
+        candidates.update(
+            model.objects.filter(created__gte=events_since)
+            .values_list('recipe_id', flat=True).distinct()
+        )
+
+    candidates = sorted(candidates)
+    with transaction.atomic():
+        for start in range(0, len(candidates), batch_size):
+            refresh_batch(candidates[start:start + batch_size], since, now)
+    return len(candidates)
+
+
+def refresh_batch(recipe_ids, since, now):
+    counts = {recipe_id: {} for recipe_id in recipe_ids}
+    for model, field in EVENTS:
+        rows = model.objects.filter(
+            created__gte=since, recipe_id__in=recipe_ids
+        ).order_by().values('recipe_id').annotate(total=Count('id'))
+        for row in rows:
+            counts[row['recipe_id']][field] = row['total']
+
+    weights = settings.TRENDING_WEIGHTS
+    ranks = []
+    for recipe_id, values in counts.items():
+        score = sum(
+            weights[field] * values.get(field, 0) for _, field in EVENTS
+        )
+        if score:
+            ranks.append(TrendingRecipe(
+                recipe_id=recipe_id,
+                score=score,
+                favorites=values.get('favorites', 0),
+                shopping_carts=values.get('shopping_carts', 0),
+                refreshed_at=now,
+            ))
+    TrendingRecipe.objects.filter(recipe_id__in=recipe_ids).delete()
+    TrendingRecipe.objects.bulk_create(ranks)
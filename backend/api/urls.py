@@ -1,4 +1,5 @@
-from django.urls import include, path
+from django.conf import settings
+from django.urls import include, path, re_path
 from rest_framework.routers import DefaultRouter
 
 from .views import (
@@ -6,7 +7,9 @@ from .views import (
     CustomUserViewSet,
     IngredientViewSet,
     RecipeViewSet,
-    redirect_view,
+    TokenCreateView,
+    TokenDestroyView,
+    get_link,
 )
 
 
@@ -19,9 +22,39 @@ router.register(r'users', CustomUserViewSet, basename='users')
 
 urlpatterns = [
     path('auth/', include('djoser.urls')),
-    path('auth/', include('djoser.urls.authtoken')),
+    re_path(
+        r'^auth/token/login/?$', TokenCreateView.as_view(), name='login'
+    ),
+    re_path(
+        r'^auth/token/logout/?$', TokenDestroyView.as_view(), name='logout'
+    ),
     path(
-        'recipes/<int:pk>/get-link/', view=redirect_view, name='short_url_view'
+        'recipes/<int:pk>/get-link/', view=get_link, name='short_url_view'
     ),
-    path('', include(router.urls)),
 ]
+
+if settings.ASYNC_READ_VIEWS:
+    from . import async_views
+
+    urlpatterns += [
+        path('tags/', async_views.tag_list, name='tags-list'),
+        path('tags/<int:pk>/', async_views.tag_detail, name='tags-detail'),
+        path(
+            'ingredients/',
+            async_views.ingredient_list,
+            name='ingredients-list',
+        ),
+        path(
+            'ingredients/<int:pk>/',
+            async_views.ingredient_detail,
+            name='ingredients-detail',
+        ),
+        path('recipes/', async_views.recipe_list, name='recipes-list'),
+        path(
+            'recipes/<int:pk>/',
+            async_views.recipe_detail,
+            name='recipes-detail',
+        ),
+    ]
+
+urlpatterns.append(path('', include(router.urls)))
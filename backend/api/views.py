@@ -1,24 +1,55 @@
-import short_url
+from djoser import views as djoser_views
 from djoser.views import UserViewSet
 from rest_framework import status, viewsets, exceptions, filters
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.http import HttpResponse
+from django.http import Http404, StreamingHttpResponse
+from django.utils.http import parse_etags
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from django.shortcuts import get_object_or_404, redirect
+from django.shortcuts import get_object_or_404
 from rest_framework.permissions import (
     IsAuthenticated,
     IsAuthenticatedOrReadOnly,
 )
 from rest_framework.decorators import action, api_view
-from django.db.models import Sum
+from functools import partial
+
+from django.db import transaction
+from django.db.models import (
+    Exists,
+    F,
+    OuterRef,
+    Prefetch,
+    prefetch_related_objects,
+)
 
-from .serializers import UserSerializer
+from .catalog import ingredient_catalog, tag_catalog
+from .db_router import ReplicaReadMixin, pin_to_primary
+from .counters import (
+    follow_changed,
+    follows_changed,
+    recipe_relation_changed,
+    recipe_relations_changed,
+)
+from .exporters import SHOPPING_LIST_FORMATS, shopping_list_rows
+from .ingredient_snapshot import get_snapshot
+from .instrumentation import InstrumentedViewMixin
+from .relations import (
+    delete_relations,
+    insert_relation,
+    insert_relations,
+    relations_changed,
+)
+from .response_cache import AnonymousResponseCacheMixin
+from .search import search_ingredients
+from .short_links import encode, recipe_exists
+from .serializers import ProfileSerializer
 from recipes.models import (
+    MATCH_MODES,
     Tag,
     Ingredient,
     Recipe,
-    RecipeIngredients,
     Favorite,
     ShoppingCart,
 )
@@ -31,6 +62,7 @@ from .serializers import (
     SubscriptionSerializer,
     ShortRecipeSerializer,
     AvatarSerializer,
+    BulkIdsSerializer,
 )
 from api.permissions import IsAdminAuthorOrReadOnly
 from api.filters import RecipeFilter
@@ -39,10 +71,92 @@ from api.filters import RecipeFilter
 User = get_user_model()
 
 
-class CustomUserViewSet(UserViewSet):
+class TokenCreateView(djoser_views.TokenCreateView):
+    """Вход: пользователь читает из основной базы, пока реплики
+    не получат его новый токен.
+    """
+
+    def _action(self, serializer):
+        response = super()._action(serializer)
+        pin_to_primary(response, serializer.user.pk)
+        return response
+
+
+class TokenDestroyView(djoser_views.TokenDestroyView):
+    """Выход: закрепление за основной базой, как после любого изменения."""
+
+    def post(self, request):
+        user_id = request.user.pk
+        response = super().post(request)
+        pin_to_primary(response, user_id)
+        return response
+
+
+class BulkRelationsMixin:
+    """Массовое добавление и удаление связей пользователя: избранного,
+    списка покупок и подписок.
+    """
+
+    def bulk_relations(self, request, model, field, targets, on_change,
+                       exclude=None):
+        """Связи model с объектами targets по списку id из тела запроса.
+
+        Объекты и уже существующие связи находятся одним запросом IN,
+        изменения вносятся одним INSERT или DELETE в одной транзакции.
+        on_change(ids, delta) обновляет счётчики. В ответе - итог
+        по каждому id: added/exists или removed/absent, not_found
+        для несуществующих объектов и self для exclude.
+        """
+        serializer = BulkIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = list(dict.fromkeys(serializer.validated_data['ids']))
+        user = request.user
+        adding = request.method == 'POST'
+        with transaction.atomic():
+            linked = dict(targets.filter(pk__in=ids).annotate(
+                linked=Exists(model.objects.filter(
+                    user=user, **{field: OuterRef('pk')}
+                ))
+            ).values_list('pk', 'linked'))
+            candidates = [
+                pk for pk in ids
+                if pk in linked and pk != exclude and linked[pk] != adding
+            ]
+            changed = []
+            if candidates:
+                # Одновременный запрос мог изменить те же связи после
+                # проверки выше: итог и счётчики - только по строкам,
+                # которые действительно вставлены или удалены здесь.
+                apply = insert_relations if adding else delete_relations
+                changed = apply(model, user.id, field, candidates)
+            if changed:
+                on_change(changed, 1 if adding else -1)
+                relations_changed(user.id)
+
+        done, skipped = (
+            ('added', 'exists') if adding else ('removed', 'absent')
+        )
+        changed = set(changed)
+        results = []
+        for pk in ids:
+            if pk not in linked:
+                result = 'not_found'
+            elif pk == exclude:
+                result = 'self'
+            else:
+                result = done if pk in changed else skipped
+            results.append({'id': pk, 'status': result})
+        return Response({'results': results})
+
+
+class CustomUserViewSet(
+    InstrumentedViewMixin, ReplicaReadMixin, BulkRelationsMixin, UserViewSet
+):
     queruset = User.objects.all()
-    serializer_class = UserSerializer
+    serializer_class = ProfileSerializer
     permission_classes = (IsAuthenticatedOrReadOnly,)
+    cursor_ordering = ('id',)
+    replica_actions = ('subscriptions',)
 
     @action(
         detail=False,
@@ -50,6 +164,7 @@ class CustomUserViewSet(UserViewSet):
         permission_classes=(IsAuthenticated,),
         url_path='me/avatar',
         url_name='avatar',
+        serializer_class=AvatarSerializer,
     )
     def avatar(self, request):
         """Добавление и удаление аватарок."""
@@ -57,7 +172,7 @@ class CustomUserViewSet(UserViewSet):
         if request.method == 'PUT':
             if not request.data:
                 raise exceptions.ValidationError('Нужно добавить фото')
-            serializer = AvatarSerializer(
+            serializer = self.get_serializer(
                 user, data=request.data, partial=True
             )
             if serializer.is_valid():
@@ -66,7 +181,8 @@ class CustomUserViewSet(UserViewSet):
                     return Response(serializer.data, status=status.HTTP_200_OK)
         obj_user = get_object_or_404(User, id=user.id)
         obj_user.avatar = None
-        obj_user.save(update_fields=['avatar'])
+        obj_user.avatar_variants = {}
+        obj_user.save(update_fields=['avatar', 'avatar_variants'])
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
@@ -76,91 +192,215 @@ class CustomUserViewSet(UserViewSet):
     )
     def me(self, request):
         obj_user = get_object_or_404(User, id=request.user.id)
-        serializer = UserSerializer(obj_user, context={'request': request})
+        serializer = self.get_serializer(obj_user)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
     @action(
         detail=False,
         methods=('get',),
         permission_classes=(IsAuthenticated,),
+        serializer_class=SubscriptionSerializer,
     )
     def subscriptions(self, request):
         user = self.request.user
-        queryset = user.follower.all()
+        # Пустое значение, как и отсутствие параметра, - без ограничения.
+        recipes_limit = request.query_params.get('recipes_limit')
+        if recipes_limit and not recipes_limit.isdigit():
+            raise exceptions.ValidationError(
+                {'recipes_limit': 'Ожидается целое неотрицательное число'}
+            )
+        queryset = user.follower.select_related('author').order_by('id')
         pages = self.paginate_queryset(queryset)
-        serializer = SubscriptionSerializer(
-            pages, many=True, context={'request': request}
-        )
+        recipes = Recipe.objects.all()
+        if recipes_limit:
+            recipes = recipes.latest_per_author(int(recipes_limit))
+        prefetch_related_objects(pages, Prefetch(
+            'author__recipes', queryset=recipes, to_attr='latest_recipes'
+        ))
+        serializer = self.get_serializer(pages, many=True)
         return self.get_paginated_response(serializer.data)
 
     @action(
         detail=True,
         methods=('post', 'delete'),
+        serializer_class=SubscriptionSerializer,
     )
+    @transaction.atomic
     def subscribe(self, request, id=None):
-        """Подписка"""
+        """Подписка: один INSERT или один DELETE без проверки exists()."""
         user = self.request.user
-        author = get_object_or_404(User, pk=id)
-
-        if user == author:
-            return Response(
-                {'errors': 'Подписаться или отписаться от себя нельзя'},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-
         if self.request.method == 'POST':
-            if Follow.objects.filter(user=user, author=author).exists():
+            author = get_object_or_404(User, pk=id)
+            if user == author:
+                return self.self_subscription_error()
+            if not insert_relation(Follow, user=user, author=author):
                 return Response(
                     {'errors': 'Уже есть подписка'},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
-
-            queryset = Follow.objects.create(author=author, user=user)
-            serializer = SubscriptionSerializer(
-                queryset, context={'request': request}
-            )
+            follow_changed(user.id, author.id, 1)
+            relations_changed(user.id)
+            serializer = self.get_serializer(Follow(user=user, author=author))
             return Response(serializer.data, status=status.HTTP_201_CREATED)
-        if not Follow.objects.filter(
-            user=user, author=author
-        ).exists():
+
+        deleted, _ = Follow.objects.filter(user=user, author_id=id).delete()
+        if not deleted:
+            author = get_object_or_404(User, pk=id)
+            if user == author:
+                return self.self_subscription_error()
             return Response(
                 {'errors': 'Уже отписаны'},
                 status=status.HTTP_400_BAD_REQUEST,
             )
+        follow_changed(user.id, int(id), -1)
+        relations_changed(user.id)
 
-        subscription = get_object_or_404(
-            Follow, user=user, author=author
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def self_subscription_error(self):
+        return Response(
+            {'errors': 'Подписаться или отписаться от себя нельзя'},
+            status=status.HTTP_400_BAD_REQUEST,
         )
-        subscription.delete()
 
-        return Response(status=status.HTTP_204_NO_CONTENT)
+    @action(
+        detail=False,
+        methods=('post', 'delete'),
+        permission_classes=(IsAuthenticated,),
+        url_path='subscribe',
+        url_name='subscribe-bulk',
+    )
+    def subscribe_bulk(self, request):
+        """Подписка на нескольких авторов или отписка от них."""
+        return self.bulk_relations(
+            request, Follow, 'author', User.objects.all(),
+            partial(follows_changed, request.user.id),
+            exclude=request.user.id,
+        )
+
+
+class CatalogViewSetMixin:
+    """Список и объекты справочника из кеша, с ETag по версии справочника.
+
+    Параметры из catalog_bypass_params (например, поиск) обрабатываются
+    обычным запросом к базе.
+    """
 
+    catalog = None
+    catalog_bypass_params = ()
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+    def list(self, request, *args, **kwargs):
+        if any(
+            param in request.query_params
+            for param in self.catalog_bypass_params
+        ):
+            return super().list(request, *args, **kwargs)
+        etag = self.catalog.etag
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            return Response(
+                status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag}
+            )
+        return Response(self.catalog.rows, headers={'ETag': etag})
+
+    def get_object(self):
+        pk = self.kwargs[self.lookup_field]
+        instance = self.catalog.get_object(int(pk)) if pk.isdigit() else None
+        if instance is None:
+            raise Http404
+        return instance
+
+
+class TagViewSet(
+    InstrumentedViewMixin,
+    ReplicaReadMixin,
+    CatalogViewSetMixin,
+    viewsets.ReadOnlyModelViewSet,
+):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
+    catalog = tag_catalog
+    replica_actions = ('list', 'retrieve')
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(
+    InstrumentedViewMixin,
+    ReplicaReadMixin,
+    CatalogViewSetMixin,
+    viewsets.ReadOnlyModelViewSet,
+):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
+    catalog = ingredient_catalog
+    catalog_bypass_params = ('name',)
     pagination_class = None
     filter_backends = (filters.SearchFilter,)
     search_fields = ('^name',)
+    replica_actions = ('list', 'retrieve')
+
+    def list(self, request, *args, **kwargs):
+        """Поиск по началу названия - по снимку справочника, если он есть."""
+        snapshot = get_snapshot()
+        terms = self.filter_backends[0]().get_search_terms(request)
+        if snapshot is None or not terms:
+            return super().list(request, *args, **kwargs)
+        terms = [term.lower() for term in terms]
+        rows = [
+            row for row in snapshot.prefix(terms[0])
+            if all(
+                snapshot.entry(row).name.lower().startswith(term)
+                for term in terms[1:]
+            )
+        ]
+        serializer = self.get_serializer(
+            list(snapshot.objects(rows)), many=True
+        )
+        return Response(serializer.data)
+
+    @action(detail=False, methods=('get',))
+    def autocomplete(self, request):
+        """Подсказки: сначала совпадения по префиксу, затем по подстроке."""
+        query = request.query_params.get('name', '').strip()
+        limit = request.query_params.get(
+            'limit', str(settings.INGREDIENT_AUTOCOMPLETE_LIMIT)
+        )
+        if not limit.isdigit() or not 0 < int(limit) <= 50:
+            raise exceptions.ValidationError(
+                {'limit': 'Ожидается число от 1 до 50'}
+            )
+        if not query:
+            return Response([])
+        serializer = self.get_serializer(
+            search_ingredients(query, int(limit)), many=True
+        )
+        return Response(serializer.data)
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(
+    InstrumentedViewMixin,
+    ReplicaReadMixin,
+    BulkRelationsMixin,
+    AnonymousResponseCacheMixin,
+    viewsets.ModelViewSet,
+):
     queryset = Recipe.objects.all()
+    serializer_class = RecipeSerializer
     permission_classes = (IsAdminAuthorOrReadOnly,)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
+    cursor_ordering = ('-pub_date', '-id')
+    replica_actions = ('list', 'retrieve')
+
+    def get_queryset(self):
+        return Recipe.objects.with_related(
+            ingredients=get_snapshot() is None
+        )
 
     def get_serializer_class(self):
         if self.action in ('create', 'partial_update'):
             return RecipeCreateUpdateSerializer
 
-        return RecipeSerializer
+        return super().get_serializer_class()
 
     def get_serializer_context(self):
         """Метод для передачи контекста. """
@@ -169,29 +409,36 @@ class RecipeViewSet(viewsets.ModelViewSet):
         context.update({'request': self.request})
         return context
 
+    @transaction.atomic
     def add(self, model, user, pk):
-        """Добавление рецепта"""
+        """Добавление рецепта одним INSERT без предварительной проверки."""
         recipe = get_object_or_404(Recipe, pk=pk)
-        relation = model.objects.filter(user=user, recipe=recipe)
-        if relation.exists():
+        if not insert_relation(model, user=user, recipe=recipe):
             return Response(
                 {'errors': 'Нельзя повторно добавить рецепт'},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        model.objects.create(user=user, recipe=recipe)
-        serializer = ShortRecipeSerializer(recipe)
+        recipe_relation_changed(model, recipe.pk, 1)
+        relations_changed(user.id)
+        serializer = self.get_serializer(recipe)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    @transaction.atomic
     def delete_relation(self, model, user, pk):
-        """Удаление рецепта из списка пользователя."""
-        recipe = get_object_or_404(Recipe, pk=pk)
-        relation = model.objects.filter(user=user, recipe=recipe)
-        if not relation.exists():
+        """Удаление рецепта из списка пользователя одним DELETE.
+
+        Рецепт ищется, только если удалять было нечего: чтобы отличить
+        несуществующий рецепт (404) от повторного удаления (400).
+        """
+        deleted, _ = model.objects.filter(user=user, recipe_id=pk).delete()
+        if not deleted:
+            get_object_or_404(Recipe, pk=pk)
             return Response(
                 {'errors': 'Нельзя повторно удалить рецепт'},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        relation.delete()
+        recipe_relation_changed(model, int(pk), -1)
+        relations_changed(user.id)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
@@ -199,6 +446,7 @@ class RecipeViewSet(viewsets.ModelViewSet):
         methods=('post', 'delete'),
         url_path='favorite',
         url_name='favorite',
+        serializer_class=ShortRecipeSerializer,
     )
     def favorite(self, request, pk=None):
         """Добавление и удаление рецептов из избранного."""
@@ -212,6 +460,7 @@ class RecipeViewSet(viewsets.ModelViewSet):
         methods=('post', 'delete'),
         url_path='shopping_cart',
         url_name='shopping_cart',
+        serializer_class=ShortRecipeSerializer,
     )
     def shopping_cart(self, request, pk=None):
         """Добавление и удаление рецептов из списока покупок."""
@@ -220,6 +469,87 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return self.add(ShoppingCart, user, pk)
         return self.delete_relation(ShoppingCart, user, pk)
 
+    @action(
+        detail=False,
+        methods=('post', 'delete'),
+        permission_classes=(IsAuthenticated,),
+        url_path='favorite',
+        url_name='favorite-bulk',
+    )
+    def favorite_bulk(self, request):
+        """Добавление и удаление нескольких рецептов в избранном."""
+        return self.bulk_relations(
+            request, Favorite, 'recipe', Recipe.objects.all(),
+            partial(recipe_relations_changed, Favorite),
+        )
+
+    @action(
+        detail=False,
+        methods=('post', 'delete'),
+        permission_classes=(IsAuthenticated,),
+        url_path='shopping_cart',
+        url_name='shopping_cart-bulk',
+    )
+    def shopping_cart_bulk(self, request):
+        """Добавление и удаление нескольких рецептов в списке покупок."""
+        return self.bulk_relations(
+            request, ShoppingCart, 'recipe', Recipe.objects.all(),
+            partial(recipe_relations_changed, ShoppingCart),
+        )
+
+    @action(detail=False, methods=('get',))
+    def trending(self, request):
+        """Популярные рецепты из рейтинга с фильтрами ленты."""
+        self.cursor_ordering = ('-trending_score', '-id')
+        queryset = self.filter_queryset(self.get_queryset()).filter(
+            trending__isnull=False
+        ).annotate(
+            trending_score=F('trending__score')
+        ).order_by(*self.cursor_ordering)
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=('get',))
+    def by_ingredients(self, request):
+        """Рецепты, которые можно приготовить из переданных ингредиентов.
+
+        Параметры: ingredients (id, можно повторять или через запятую),
+        match=all|any|missing и max_missing для режима missing.
+        """
+        ingredient_ids = [
+            value
+            for param in request.query_params.getlist('ingredients')
+            for value in param.split(',') if value
+        ]
+        if not ingredient_ids or not all(
+            value.isdigit() for value in ingredient_ids
+        ):
+            raise exceptions.ValidationError(
+                {'ingredients': 'Ожидается список id ингредиентов'}
+            )
+        mode = request.query_params.get('match', 'all')
+        if mode not in MATCH_MODES:
+            raise exceptions.ValidationError(
+                {'match': 'Доступные режимы: ' + ', '.join(MATCH_MODES)}
+            )
+        max_missing = request.query_params.get('max_missing', '1')
+        if not max_missing.isdigit():
+            raise exceptions.ValidationError(
+                {'max_missing': 'Ожидается целое неотрицательное число'}
+            )
+
+        self.cursor_ordering = None
+        page = self.paginate_queryset(
+            self.get_queryset().matching_ingredients(
+                map(int, ingredient_ids), mode, int(max_missing)
+            )
+        )
+        data = self.get_serializer(page, many=True).data
+        for item, recipe in zip(data, page):
+            item['missing_ingredients'] = recipe.missing_ingredients
+        return self.get_paginated_response(data)
+
     @action(
         detail=False,
         methods=('get',),
@@ -228,44 +558,32 @@ class RecipeViewSet(viewsets.ModelViewSet):
         url_name='download_shopping_cart',
     )
     def download_shopping_cart(self, request):
-        shopping_cart = ShoppingCart.objects.filter(user=self.request.user)
-        recipes = [item.recipe.id for item in shopping_cart]
-        buy = (
-            RecipeIngredients.objects.filter(recipe__in=recipes)
-            .values('ingredient')
-            .annotate(amount=Sum('amount'))
-        )
-
-        purchased = [
-            'Список покупок:',
-        ]
-        for item in buy:
-            ingredient = Ingredient.objects.get(pk=item['ingredient'])
-            amount = item['amount']
-            purchased.append(
-                f'{ingredient.name}: {amount}, '
-                f'{ingredient.measurement_unit}'
+        """Список покупок в формате txt, csv или json."""
+        file_format = request.query_params.get('file_format', 'txt')
+        if file_format not in SHOPPING_LIST_FORMATS:
+            raise exceptions.ValidationError(
+                {'file_format': 'Доступные форматы: '
+                 + ', '.join(SHOPPING_LIST_FORMATS)}
             )
-        purchased_in_file = '\n'.join(purchased)
+        export, content_type = SHOPPING_LIST_FORMATS[file_format]
 
-        response = HttpResponse(purchased_in_file, content_type='text/plain')
+        response = StreamingHttpResponse(
+            export(shopping_list_rows(request.user)),
+            content_type=content_type,
+        )
         response[
             'Content-Disposition'
-        ] = 'attachment; filename=shopping-list.txt'
+        ] = f'attachment; filename=shopping-list.{file_format}'
 
         return response
 
 
 @api_view(['GET'])
-def redirect_view(request, pk=None):
-    host_url = f'{str(request.scheme)}://{str(request.get_host())}'
-    if pk:
-        my_short_url = (
-            f'{host_url}/s/{short_url.encode_url(pk)}'
-        )
-        return Response(
-            {'short-link': my_short_url},
-            status=status.HTTP_200_OK
-        )
-    pk_recipe = short_url.decode_url(str(request.path)[3:])
-    return redirect(f'{host_url}/recipes/{pk_recipe}/')
+def get_link(request, pk):
+    """Короткая ссылка на рецепт."""
+    if not recipe_exists(pk):
+        raise Http404
+    return Response(
+        {'short-link': request.build_absolute_uri(f'/s/{encode(pk)}')},
+        status=status.HTTP_200_OK
+    )
@@ -9,8 +9,19 @@ https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
 
 import os
 
+from asgiref.sync import ThreadSensitiveContext
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+
+async def application(scope, receive, send):
+    """Синхронный код каждого запроса (ORM, представления DRF) идёт
+    в своём потоке. Без этого Django 3.2 выполняет его для всех
+    запросов в одном общем потоке, и медленный запрос к базе
+    задерживает остальные.
+    """
+    async with ThreadSensitiveContext():
+        await django_application(scope, receive, send)
@@ -41,6 +41,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -85,6 +86,29 @@ DATABASES = {
     }
 }
 
+# Реплики только для чтения: DB_REPLICA_HOSTS=host1,host2:5433, остальные
+# параметры подключения как у основной базы. С реплик читают действия
+# из replica_actions вьюсетов (api.db_router).
+DATABASE_REPLICAS = []
+for number, address in enumerate(
+    filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(',')), start=1
+):
+    host, _, port = address.strip().partition(':')
+    alias = f'replica{number}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['api.db_router.ReplicaRouter']
+
+# Сколько секунд после изменения данных клиент читает из основной базы,
+# пока реплики догоняют её.
+DATABASE_PRIMARY_PIN_SECONDS = 5
+
 # DATABASES = {
 #     'default': {
 #         'ENGINE': 'django.db.backends.sqlite3',
@@ -93,6 +117,34 @@ DATABASES = {
 # }
 
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+# Кеш, общий для всех воркеров (memcached, файловый и т.п.). Если он не
+# задан через CACHE_BACKEND, версии кешей видны только своему процессу:
+# кеш ответов для анонимов выключен, справочники загружаются заново
+# в каждом запросе, а массив id рецептов для коротких ссылок (его
+# промахи перепроверяются запросом) устаревает через API_LOCAL_CACHE_TTL
+# секунд.
+API_CACHE_ALIAS = 'default' if os.getenv('CACHE_BACKEND') else None
+
+API_LOCAL_CACHE_TTL = 60
+
+# Время жизни готовых ответов ленты и страниц рецептов для анонимных
+# пользователей; без общего кеша ответы не кешируются.
+RECIPE_RESPONSE_CACHE_TIMEOUT = 60 * 10
+
+# Время жизни id избранного, списка покупок и подписок пользователя
+# в общем кеше; актуальность держится версией связей пользователя.
+USER_RELATIONS_CACHE_TIMEOUT = 60 * 60
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -116,8 +168,8 @@ AUTH_USER_MODEL = 'users.User'
 DJOSER = {
     'LOGIN_FIELD': 'email',
     'SERIALIZERS': {
-        'user': 'api.serializers.UserSerializer',
-        'current_user': 'api.serializers.UserSerializer',
+        'user': 'api.serializers.ProfileSerializer',
+        'current_user': 'api.serializers.ProfileSerializer',
     },
     'PERMISSIONS': {
         'user_list': ['rest_framework.permissions.AllowAny'],
@@ -166,6 +218,111 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
 CSV_FILES_DIR = os.path.join(BASE_DIR, 'data')
 
+# Изображения из base64: допустимые форматы и наибольшая сторона.
+# Уменьшенные копии (наибольшая сторона в пикселях) нарезает команда
+# process_images по задачам из очереди в IMAGE_QUEUE_DIR.
+IMAGE_ALLOWED_FORMATS = ('jpeg', 'jpg', 'png', 'gif', 'webp')
+IMAGE_MAX_SIDE = 6000
+IMAGE_VARIANT_SIZES = {
+    'thumbnail': 160,
+    'card': 480,
+    'full': 1280,
+}
+IMAGE_QUEUE_DIR = os.getenv(
+    'IMAGE_QUEUE_DIR', os.path.join(BASE_DIR, 'image_queue')
+)
+
+# Поиск ингредиентов для автодополнения: 'database' (индексы PostgreSQL)
+# или 'memory' (отсортированный массив в памяти процесса). По умолчанию
+# выбирается по движку базы данных.
+INGREDIENT_SEARCH_BACKEND = os.getenv('INGREDIENT_SEARCH_BACKEND')
+
+INGREDIENT_AUTOCOMPLETE_LIMIT = 10
+
+# Наибольшее число id в одном запросе массового добавления или удаления
+# рецептов в избранном, списке покупок и подписок.
+BULK_RELATIONS_LIMIT = 100
+
+# Снимок справочника ингредиентов, который воркеры отображают в память
+# вместо собственных копий справочника. Строится командой
+# build_ingredient_snapshot; изменение ингредиентов помечает его
+# устаревшим до следующей сборки (build_ingredient_snapshot --if-stale
+# по cron). Замена файла проверяется раз в
+# INGREDIENT_SNAPSHOT_CHECK_INTERVAL с.
+INGREDIENT_SNAPSHOT_PATH = os.getenv(
+    'INGREDIENT_SNAPSHOT_PATH',
+    os.path.join(BASE_DIR, 'data', 'ingredients.snapshot'),
+)
+INGREDIENT_SNAPSHOT_CHECK_INTERVAL = 1
+
+# Конфигурация полнотекстового поиска рецептов в PostgreSQL.
+RECIPE_SEARCH_CONFIG = os.getenv('RECIPE_SEARCH_CONFIG', 'russian')
+
+# Короткие ссылки /s/<code>: 301 вместо 302 и время кеширования
+# перехода браузерами и прокси (0 - без Cache-Control).
+SHORT_LINK_PERMANENT_REDIRECT = (
+    os.getenv('SHORT_LINK_PERMANENT_REDIRECT', 'False') == 'True'
+)
+SHORT_LINK_CACHE_MAX_AGE = int(os.getenv('SHORT_LINK_CACHE_MAX_AGE', 0))
+
+# Асинхронные представления чтения рецептов, справочников и коротких
+# ссылок (api.async_views). Имеет смысл под ASGI-сервером, см. README.
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS', 'False') == 'True'
+
+# Замеры запросов: заголовок Server-Timing и журнал api.instrumentation.
+# Запрос, выполнивший больше SQL-запросов, чем бюджет его действия
+# (например, 'RecipeViewSet.list'), записывается как предупреждение;
+# по тем же бюджетам проверяет маршруты команда benchmark_api.
+# Бюджеты учитывают запрос токена при авторизации, а также запрос связей
+# пользователя (api.relations) и загрузку справочников, которые без
+# общего кеша выполняются в каждом запросе. Создание рецепта
+# перепроверяет теги и ингредиенты одним запросом и на PostgreSQL
+# записывает массив id ингредиентов.
+# Server-Timing раскрывает внутренние замеры, поэтому по умолчанию
+# включён только с DEBUG.
+SERVER_TIMING = os.getenv('SERVER_TIMING', str(DEBUG)) == 'True'
+REQUEST_QUERY_BUDGET = 20
+REQUEST_QUERY_BUDGETS = {
+    'RecipeViewSet.list': 7,
+    'RecipeViewSet.retrieve': 5,
+    'RecipeViewSet.trending': 7,
+    'RecipeViewSet.by_ingredients': 6,
+    'RecipeViewSet.create': 16,
+    'RecipeViewSet.download_shopping_cart': 2,
+    'CustomUserViewSet.subscriptions': 7,
+    'CustomUserViewSet.list': 4,
+    'CustomUserViewSet.me': 3,
+    'IngredientViewSet.list': 2,
+    'TagViewSet.list': 2,
+    'short_url_view': 1,
+    'short_link_redirect': 0,
+}
+
+# Строки о каждом запросе пишутся с уровнем DEBUG и по умолчанию
+# отключены; превышения бюджетов (WARNING) видны всегда. Включить все
+# строки: INSTRUMENTATION_LOG_LEVEL=DEBUG.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'api.instrumentation': {
+            'handlers': ['console'],
+            'level': os.getenv('INSTRUMENTATION_LOG_LEVEL', 'INFO'),
+        },
+    },
+}
+
+# Популярные рецепты: окно в днях и вес добавлений каждого вида.
+# Рейтинг пересчитывает команда refresh_trending (например, по cron).
+TRENDING_WINDOW_DAYS = 7
+TRENDING_WEIGHTS = {
+    'favorites': 2,
+    'shopping_carts': 1,
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -17,10 +17,19 @@ from django.contrib import admin
 from django.urls import path, include, re_path
 from django.conf.urls.static import static
 from django.conf import settings
-from api.views import redirect_view
+from api.short_links import short_link_redirect
+
+if settings.ASYNC_READ_VIEWS:
+    from api.async_views import short_link
+else:
+    short_link = short_link_redirect
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
-    re_path(r'^s/\w+', view=redirect_view, name='short_url_view'),
+    re_path(
+        r'^s/(?P<code>\w+)/?$',
+        view=short_link,
+        name='short_link_redirect',
+    ),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -1,4 +1,7 @@
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.postgres.search import SearchQuery
+from django.db import connection
 
 from recipes.models import Ingredient, Recipe, Tag
 
@@ -15,10 +18,31 @@ class RecipeTagsInLine(admin.TabularInline):
 
 class RecipeAdmin(admin.ModelAdmin):
     list_display = ('id', 'name', 'text', 'pub_date', 'author')
-    search_fields = ('name', 'author')
+    search_fields = ('name', 'author__username')
     inlines = (RecipeIngredientsInLine, RecipeTagsInLine)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        """В PostgreSQL к поиску по search_fields добавляется совпадение
+        по поисковому вектору рецепта (ИЛИ).
+        """
+        results, may_have_duplicates = super().get_search_results(
+            request, queryset, search_term
+        )
+        if not search_term or connection.vendor != 'postgresql':
+            return results, may_have_duplicates
+        return results | queryset.filter(search_vector=SearchQuery(
+            search_term,
+            config=settings.RECIPE_SEARCH_CONFIG,
+            search_type='websearch',
+        )), may_have_duplicates
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        recipes = Recipe.objects.filter(pk=form.instance.pk)
+        recipes.update_search_vector()
+        recipes.update_ingredient_ids()
+
 
 class IngredientAdmin(admin.ModelAdmin):
     list_display = ('id', 'name', 'measurement_unit')
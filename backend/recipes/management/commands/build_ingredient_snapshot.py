@@ -0,0 +1,31 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.ingredient_snapshot import build_snapshot, snapshot_file
+
+
+class Command(BaseCommand):
+    """Снимок справочника ингредиентов для отображения в память воркеров."""
+
+    help = 'Сборка снимка справочника ингредиентов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--if-stale', action='store_true',
+            help='Только если снимок отстал от базы (для запуска по cron).',
+        )
+
+    def handle(self, *args, **options):
+        if options['if_stale'] and not snapshot_file.is_stale():
+            return
+        started = time.monotonic()
+        count = build_snapshot()
+        path = settings.INGREDIENT_SNAPSHOT_PATH
+        self.stdout.write(self.style.SUCCESS(
+            f'{path}: {count} ингредиентов, '
+            f'{os.path.getsize(path) / 1024:.0f} КБ '
+            f'за {time.monotonic() - started:.2f} с'
+        ))
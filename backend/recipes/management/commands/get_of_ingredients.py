@@ -1,29 +1,207 @@
 import csv
+import io
+import json
+import os
+import re
+import time
+from itertools import islice
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
 
+from api.catalog import ingredient_catalog
+from api.ingredient_snapshot import build_snapshot, snapshot_file
 from backend.settings import CSV_FILES_DIR
 from recipes.models import Ingredient
 
+HEADER = ('name', 'measurement_unit')
+READ_SIZE = 64 * 1024
+# Пробелы и разделители между объектами массива или строками JSON Lines.
+SEPARATORS = re.compile(r'[\s,\[\]]*')
+
+
+def read_csv(file):
+    """Пустые строки файла пропускаются, неполные дополняются пустыми
+    значениями и отсеиваются с сообщением в Command.clean.
+    """
+    reader = csv.reader(file)
+    for number, row in enumerate(reader):
+        if not row or number == 0 and tuple(row) == HEADER:
+            continue
+        name, measurement_unit = (row + ['', ''])[:2]
+        yield name, measurement_unit
+
+
+def read_json(file):
+    """Объекты JSON-массива или JSON Lines по одному, не весь файл.
+
+    Разбор идёт по позиции в буфере; буфер обрезается один раз на
+    прочитанную порцию файла, а не после каждого объекта.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    eof = False
+    while True:
+        position = SEPARATORS.match(buffer, position).end()
+        if position == len(buffer):
+            if eof:
+                return
+            buffer, position = file.read(READ_SIZE), 0
+            eof = not buffer
+            continue
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            chunk = file.read(READ_SIZE)
+            if not chunk:
+                raise CommandError(
+                    f'Некорректный JSON: {buffer[position:position + 80]}'
+                )
+            buffer, position = buffer[position:] + chunk, 0
+            continue
+        if not isinstance(item, dict):
+            raise CommandError(
+                'Ожидается объект ингредиента, получено: '
+                f'{json.dumps(item, ensure_ascii=False)[:80]}'
+            )
+        yield item.get('name', ''), item.get('measurement_unit', '')
+
+
+READERS = {'csv': read_csv, 'json': read_json, 'jsonl': read_json}
+
+
+class RowsStream(io.TextIOBase):
+    """Строки ингредиентов как CSV-файл для COPY FROM STDIN."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.buffer = ''
+        self.count = 0
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        output = io.StringIO()
+        writer = csv.writer(output)
+        while size < 0 or len(self.buffer) < size:
+            row = next(self.rows, None)
+            if row is None:
+                break
+            writer.writerow(row)
+            self.count += 1
+            self.buffer += output.getvalue()
+            output.seek(0)
+            output.truncate()
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
 
 class Command(BaseCommand):
     """Команда для загрузки ингредиентов в базу данных """
 
     help = 'Загрузка ингредиентов в базу данных'
 
-    def handle(self, *args, **kwargs):
-        with open(
-                f'{CSV_FILES_DIR}/ingredients.csv', encoding='utf-8'
-        ) as file:
-            reader = csv.reader(file)
-            next(reader)
-            ingredients = [
-                Ingredient(
-                    name=row[0],
-                    measurement_unit=row[1],
-                )
-                for row in reader
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default=os.path.join(CSV_FILES_DIR, 'ingredients.csv'),
+            help='Файл CSV, JSON или JSON Lines.',
+        )
+        parser.add_argument(
+            '--format',
+            choices=tuple(READERS),
+            default=None,
+            help='Формат файла, по умолчанию - по расширению.',
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--copy',
+            action='store_true',
+            help='Загрузка через COPY во временную таблицу (PostgreSQL).',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = (
+            options['format'] or os.path.splitext(path)[1].lstrip('.')
+        )
+        if file_format not in READERS:
+            raise CommandError(f'Неизвестный формат файла: {path}')
+        if options['copy'] and connection.vendor != 'postgresql':
+            raise CommandError('--copy поддерживается только PostgreSQL')
+
+        started = time.monotonic()
+        before = Ingredient.objects.count()
+        with open(path, encoding='utf-8') as file:
+            rows = self.clean(READERS[file_format](file))
+            if options['copy']:
+                read = self.copy(rows)
+            else:
+                read = self.bulk_insert(rows, options['batch_size'])
+        ingredient_catalog.invalidate()
+        if snapshot_file.is_stale():
+            build_snapshot()
+
+        elapsed = time.monotonic() - started
+        added = Ingredient.objects.count() - before
+        self.stdout.write(self.style.SUCCESS(
+            f'Прочитано {read}, добавлено {added}, '
+            f'пропущено дублей {read - added} за {elapsed:.2f} с '
+            f'({read / max(elapsed, 1e-6):.0f} строк/с)'
+        ))
+
+    def clean(self, rows):
+        name_length = Ingredient._meta.get_field('name').max_length
+        unit_length = Ingredient._meta.get_field(
+            'measurement_unit'
+        ).max_length
+        for name, measurement_unit in rows:
+            name, measurement_unit = name.strip(), measurement_unit.strip()
+            if (
+                not name or not measurement_unit
+                or len(name) > name_length
+                or len(measurement_unit) > unit_length
+            ):
+                self.stderr.write(f'Пропущена строка: {name!r}')
+                continue
+            yield name, measurement_unit
+
+    def bulk_insert(self, rows, batch_size):
+        read = 0
+        while True:
+            batch = [
+                Ingredient(name=name, measurement_unit=measurement_unit)
+                for name, measurement_unit in islice(rows, batch_size)
             ]
-            Ingredient.objects.bulk_create(ingredients)
-        print('Ингредиенты в базу данных загружены')
-        print('ADD', Ingredient.objects.count(), 'Ingredient')
+            if not batch:
+                return read
+            Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+            read += len(batch)
+            self.stdout.write(f'Обработано {read}')
+
+    def copy(self, rows):
+        table = Ingredient._meta.db_table
+        stream = RowsStream(rows)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMPORARY TABLE ingredient_import '
+                '(name varchar(256), measurement_unit varchar(20)) '
+                'ON COMMIT DROP'
+            )
+            cursor.copy_expert(
+                'COPY ingredient_import (name, measurement_unit) '
+                'FROM STDIN WITH (FORMAT csv)',
+                stream,
+            )
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                'SELECT DISTINCT name, measurement_unit '
+                'FROM ingredient_import '
+                'ON CONFLICT (name, measurement_unit) DO NOTHING'
+            )
+        return stream.count
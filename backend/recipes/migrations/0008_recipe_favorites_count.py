@@ -0,0 +1,42 @@
+# Generated by Django 3.2.16 on 2026-10-18 06:07
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+# (модель, поле счётчика, связанная модель, внешний ключ на модель).
+COUNTERS = (
+    ('users.User', 'recipes_count', 'recipes.Recipe', 'author'),
+    ('users.User', 'followers_count', 'users.Follow', 'author'),
+    ('users.User', 'following_count', 'users.Follow', 'user'),
+    ('recipes.Recipe', 'favorites_count', 'recipes.Favorite', 'recipe'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for model, field, related, foreign_key in COUNTERS:
+        related = apps.get_model(related)
+        apps.get_model(model).objects.update(**{field: Coalesce(Subquery(
+            related.objects.filter(**{foreign_key: OuterRef('pk')})
+            .order_by()
+            .values(foreign_key)
+            .annotate(total=Count('pk'))
+            .values('total')
+        ), 0)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_ingredient_unique_measurement_unit'),
+        ('users', '0003_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном у пользователей'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 3.2.16 on 2026-10-18 06:08
+
+import datetime
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+# Существующим связям дата добавления неизвестна: они получают дату
+# далеко за окном рейтинга, иначе первый пересчёт счёл бы всё избранное
+# за всё время свежим. Новые строки получают timezone.now из модели.
+UNKNOWN_CREATED = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def backdate_existing(apps, schema_editor):
+    for name in ('Favorite', 'ShoppingCart'):
+        apps.get_model('recipes', name).objects.update(
+            created=UNKNOWN_CREATED
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_recipe_favorites_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingRecipe',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trending', serialize=False, to='recipes.recipe', verbose_name='Рецепт')),
+                ('score', models.PositiveIntegerField(verbose_name='Рейтинг')),
+                ('favorites', models.PositiveIntegerField(verbose_name='Добавлений в избранное за окно')),
+                ('shopping_carts', models.PositiveIntegerField(verbose_name='Добавлений в список покупок за окно')),
+                ('refreshed_at', models.DateTimeField(verbose_name='Дата пересчёта')),
+            ],
+            options={
+                'verbose_name': 'Популярный рецепт',
+                'verbose_name_plural': 'Популярные рецепты',
+            },
+        ),
+        migrations.AddField(
+            model_name='favorite',
+            name='created',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Дата добавления в избранное'),
+        ),
+        migrations.AddField(
+            model_name='shoppingcart',
+            name='created',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Дата добавления в список покупок'),
+        ),
+        migrations.RunPython(backdate_existing, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='favorite',
+            index=models.Index(fields=['created', 'recipe'], name='favorite_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shoppingcart',
+            index=models.Index(fields=['created', 'recipe'], name='shopping_list_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trendingrecipe',
+            index=models.Index(fields=['-score'], name='trending_score_idx'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+from django.contrib.postgres.fields import ArrayField
+from django.db import migrations, models
+from django.db.models import Func, OuterRef, Subquery
+
+import recipes.models
+
+# Массив и GIN-индекс нужны только PostgreSQL: на остальных базах
+# подбор по ингредиентам идёт через соединение с RecipeIngredients.
+CREATE_INDEX = (
+    'CREATE INDEX IF NOT EXISTS recipes_recipe_ingredient_ids_idx '
+    'ON recipes_recipe USING gin (ingredient_ids);'
+)
+DROP_INDEX = 'DROP INDEX IF EXISTS recipes_recipe_ingredient_ids_idx;'
+
+
+def fill_ingredient_ids(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeIngredients = apps.get_model('recipes', 'RecipeIngredients')
+    Recipe.objects.update(ingredient_ids=Func(
+        Subquery(
+            RecipeIngredients.objects.filter(
+                recipe=OuterRef('pk')
+            ).order_by('ingredient_id').values('ingredient_id')
+        ),
+        template='ARRAY%(expressions)s',
+        output_field=ArrayField(models.IntegerField()),
+    ))
+    schema_editor.execute(CREATE_INDEX)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='ingredient_ids',
+            field=recipes.models.IntegerArrayField(base_field=models.IntegerField(), editable=False, null=True, size=None, verbose_name='Id ингредиентов'),
+        ),
+        migrations.RunPython(fill_ingredient_ids, drop_index),
+    ]
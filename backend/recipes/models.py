@@ -1,9 +1,46 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.db import connections, models
+from django.db.models import (
+    Count,
+    F,
+    FloatField,
+    Func,
+    OuterRef,
+    Prefetch,
+    Q,
+    Subquery,
+)
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast
 from django.core.validators import MinValueValidator
+from django.utils import timezone
 
 User = get_user_model()
 
+# Режимы подбора рецептов по ингредиентам, см. matching_ingredients().
+MATCH_MODES = ('all', 'any', 'missing')
+
+
+class IntegerArrayField(ArrayField):
+    """Массив целых чисел PostgreSQL.
+
+    На остальных базах колонка остаётся пустой, и значение вставляется
+    без приведения к типу массива, которого там нет.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs.pop('base_field', None)
+        super().__init__(models.IntegerField(), **kwargs)
+
+    def get_placeholder(self, value, compiler, connection):
+        if connection.vendor != 'postgresql':
+            return '%s'
+        return super().get_placeholder(value, compiler, connection)
+
 
 class Tag(models.Model):
     """Тег"""
@@ -44,11 +81,136 @@ class Ingredient(models.Model):
         ordering = ['name']
         verbose_name = 'ингредиент'
         verbose_name_plural = 'ингредиенты'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('name', 'measurement_unit'),
+                name='unique_ingredient_measurement_unit',
+            ),
+        )
 
     def __str__(self):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+
+    def with_related(self, ingredients=True):
+        """Автор, теги и ингредиенты рецепта без ленивых запросов.
+
+        Поисковый вектор нужен только в SQL и не загружается. При
+        ingredients=False строки рецепта загружаются без самих
+        ингредиентов - когда их названия известны без базы.
+        """
+        recipe_ingredients = RecipeIngredients.objects.all()
+        if ingredients:
+            recipe_ingredients = recipe_ingredients.select_related(
+                'ingredient'
+            )
+        return self.select_related('author').defer(
+            'search_vector', 'ingredient_ids'
+        ).prefetch_related(
+            'tags',
+            Prefetch('recipe_ingredients', queryset=recipe_ingredients),
+        )
+
+    def latest_per_author(self, limit):
+        """Не более limit последних рецептов каждого автора одним запросом."""
+        return self.filter(pk__in=Subquery(
+            self.model.objects.filter(
+                author=OuterRef('author')
+            ).order_by('-pub_date').values('pk')[:limit]
+        ))
+
+    def update_search_vector(self):
+        """Пересчитывает поисковый вектор: название, ингредиенты, описание.
+
+        Только для PostgreSQL, на остальных базах поиск идёт без вектора.
+        """
+        if connections[self.db].vendor != 'postgresql':
+            return 0
+        config = settings.RECIPE_SEARCH_CONFIG
+        ingredient_names = RecipeIngredients.objects.filter(
+            recipe=OuterRef('pk')
+        ).order_by().values('recipe').annotate(
+            names=StringAgg('ingredient__name', ' ')
+        ).values('names')
+        return self.update(search_vector=(
+            SearchVector('name', weight='A', config=config)
+            + SearchVector(
+                Subquery(ingredient_names), weight='B', config=config
+            )
+            + SearchVector('text', weight='C', config=config)
+        ))
+
+    def update_ingredient_ids(self):
+        """Пересчитывает массив id ингредиентов рецепта.
+
+        Только для PostgreSQL, на остальных базах подбор по ингредиентам
+        идёт через соединение с RecipeIngredients.
+        """
+        if connections[self.db].vendor != 'postgresql':
+            return 0
+        return self.update(ingredient_ids=Func(
+            Subquery(
+                RecipeIngredients.objects.filter(
+                    recipe=OuterRef('pk')
+                ).order_by('ingredient_id').values('ingredient_id')
+            ),
+            template='ARRAY%(expressions)s',
+            output_field=ArrayField(models.IntegerField()),
+        ))
+
+    def matching_ingredients(self, ingredient_ids, mode='all',
+                             max_missing=0):
+        """Рецепты, которые можно приготовить из переданных ингредиентов.
+
+        all - есть все ингредиенты рецепта; any - хотя бы один;
+        missing - не хватает не более max_missing. Каждый рецепт получает
+        missing_ingredients; порядок - по доле имеющихся ингредиентов,
+        затем по новизне. На PostgreSQL отбор идёт по GIN-индексу
+        массива ingredient_ids.
+        """
+        ingredient_ids = sorted(set(ingredient_ids))
+        if connections[self.db].vendor == 'postgresql':
+            queryset = self.filter(ingredient_ids__overlap=ingredient_ids)
+            if mode == 'all':
+                queryset = queryset.filter(
+                    ingredient_ids__contained_by=ingredient_ids
+                )
+            queryset = queryset.annotate(
+                matched=RawSQL(
+                    'SELECT count(*) FROM unnest('
+                    f'{self.model._meta.db_table}.ingredient_ids) AS id '
+                    'WHERE id = ANY(%s)',
+                    (ingredient_ids,),
+                    output_field=models.IntegerField(),
+                ),
+                total=Func(
+                    F('ingredient_ids'), function='cardinality',
+                    output_field=models.IntegerField(),
+                ),
+            )
+        else:
+            queryset = self.annotate(
+                matched=Count(
+                    'recipe_ingredients',
+                    filter=Q(
+                        recipe_ingredients__ingredient_id__in=ingredient_ids
+                    ),
+                ),
+                total=Count('recipe_ingredients'),
+            ).filter(matched__gt=0)
+        queryset = queryset.annotate(
+            missing_ingredients=F('total') - F('matched'),
+            coverage=Cast('matched', FloatField()) / F('total'),
+        )
+        if mode == 'all':
+            queryset = queryset.filter(missing_ingredients=0)
+        elif mode == 'missing':
+            queryset = queryset.filter(missing_ingredients__lte=max_missing)
+        return queryset.order_by('-coverage', '-id')
+
+
 class Recipe(models.Model):
     """Рецепты"""
 
@@ -63,6 +225,12 @@ class Recipe(models.Model):
         verbose_name='Картинка',
         upload_to='recipes/',
     )
+    image_variants = models.JSONField(
+        verbose_name='Уменьшенные копии картинки',
+        default=dict,
+        blank=True,
+        editable=False,
+    )
     text = models.TextField(
         verbose_name='Описание'
     )
@@ -88,11 +256,35 @@ class Recipe(models.Model):
         verbose_name='Дата публикации рецепта',
         auto_now_add=True,
     )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='В избранном у пользователей',
+        default=0,
+        editable=False,
+    )
+    search_vector = SearchVectorField(
+        verbose_name='Поисковый вектор',
+        null=True,
+        editable=False,
+    )
+    ingredient_ids = IntegerArrayField(
+        verbose_name='Id ингредиентов',
+        null=True,
+        editable=False,
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = (
+            models.Index(fields=('-pub_date',), name='recipe_pub_date_idx'),
+            models.Index(
+                fields=('author', '-pub_date'),
+                name='recipe_author_pub_date_idx',
+            ),
+        )
 
     def __str__(self):
         return f'{self.name}'
@@ -133,11 +325,22 @@ class Favorite(models.Model):
         related_name='favorite',
         verbose_name='Рецепт',
     )
+    created = models.DateTimeField(
+        verbose_name='Дата добавления в избранное',
+        default=timezone.now,
+    )
 
     class Meta:
         verbose_name = 'Избранное'
         verbose_name_plural = 'Избранное'
-
+        indexes = (
+            models.Index(
+                fields=('recipe', 'user'), name='favorite_recipe_user_idx'
+            ),
+            models.Index(
+                fields=('created', 'recipe'), name='favorite_created_idx'
+            ),
+        )
         constraints = (
             models.UniqueConstraint(
                 fields=('user', 'recipe'), name='unique_favorite_recipe'
@@ -161,11 +364,22 @@ class ShoppingCart(models.Model):
         related_name='shopping_list',
         verbose_name='Рецепт',
     )
+    created = models.DateTimeField(
+        verbose_name='Дата добавления в список покупок',
+        default=timezone.now,
+    )
 
     class Meta:
         verbose_name = 'Список покупок'
         verbose_name_plural = 'Список покупок'
-
+        indexes = (
+            models.Index(
+                fields=('recipe', 'user'), name='shopping_list_recipe_user_idx'
+            ),
+            models.Index(
+                fields=('created', 'recipe'), name='shopping_list_created_idx'
+            ),
+        )
         constraints = (
             models.UniqueConstraint(
                 fields=('user', 'recipe'), name='unique_shopping_list_recipe'
@@ -176,3 +390,35 @@ class ShoppingCart(models.Model):
         return (
             f'{self.recipe}, {self.user}'
         )
+
+
+class TrendingRecipe(models.Model):
+    """Рейтинг рецепта за скользящее окно, пересчитывается командой
+    refresh_trending.
+    """
+
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='trending',
+        verbose_name='Рецепт',
+    )
+    score = models.PositiveIntegerField(verbose_name='Рейтинг')
+    favorites = models.PositiveIntegerField(
+        verbose_name='Добавлений в избранное за окно'
+    )
+    shopping_carts = models.PositiveIntegerField(
+        verbose_name='Добавлений в список покупок за окно'
+    )
+    refreshed_at = models.DateTimeField(verbose_name='Дата пересчёта')
+
+    class Meta:
+        verbose_name = 'Популярный рецепт'
+        verbose_name_plural = 'Популярные рецепты'
+        indexes = (
+            models.Index(fields=('-score',), name='trending_score_idx'),
+        )
+
+    def __str__(self):
+        return f'{self.recipe_id}: {self.score}'
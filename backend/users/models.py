@@ -48,6 +48,31 @@ class User(AbstractUser):
         null=True
     )
 
+    avatar_variants = models.JSONField(
+        verbose_name='Уменьшенные копии аватара',
+        default=dict,
+        blank=True,
+        editable=False,
+    )
+
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Число рецептов',
+        default=0,
+        editable=False,
+    )
+
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Число подписчиков',
+        default=0,
+        editable=False,
+    )
+
+    following_count = models.PositiveIntegerField(
+        verbose_name='Число подписок',
+        default=0,
+        editable=False,
+    )
+
     class Meta(AbstractUser.Meta):
         ordering = ['username']
         verbose_name = 'Пользователь'